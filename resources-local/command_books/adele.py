@@ -89,30 +89,28 @@ class Adjust(Command):
     def main(self):
         counter = self.max_steps
         toggle = True
-        error = utils.distance(config.player_pos, self.target)
+        error = utils.distance(utils.predict_player(settings.stop_lag), self.target)
         while config.enabled and counter > 0 and error > settings.adjust_tolerance:
             if toggle:
-                d_x = self.target[0] - config.player_pos[0]
+                d_x = self.target[0] - utils.predict_player(settings.stop_lag)[0]
                 threshold = settings.adjust_tolerance / math.sqrt(2)
                 if abs(d_x) > threshold:
-                    walk_counter = 0
+                    deadline = time.time() + 3
                     if d_x < 0:
                         key_down('left')
-                        while config.enabled and d_x < -1 * threshold and walk_counter < 60:
-                            time.sleep(0.05)
-                            walk_counter += 1
-                            d_x = self.target[0] - config.player_pos[0]
+                        while config.enabled and d_x < -1 * threshold and time.time() < deadline:
+                            config.capture.wait_for_next(timeout=0.05)
+                            d_x = self.target[0] - utils.predict_player(settings.stop_lag)[0]
                         key_up('left')
                     else:
                         key_down('right')
-                        while config.enabled and d_x > threshold and walk_counter < 60:
-                            time.sleep(0.05)
-                            walk_counter += 1
-                            d_x = self.target[0] - config.player_pos[0]
+                        while config.enabled and d_x > threshold and time.time() < deadline:
+                            config.capture.wait_for_next(timeout=0.05)
+                            d_x = self.target[0] - utils.predict_player(settings.stop_lag)[0]
                         key_up('right')
                     counter -= 1
             else:
-                d_y = self.target[1] - config.player_pos[1]
+                d_y = self.target[1] - utils.predict_player(settings.stop_lag)[1]
                 if abs(d_y) > settings.adjust_tolerance / math.sqrt(2):
                     if d_y < 0:
                         FlashJump('up').main()
@@ -123,7 +121,8 @@ class Adjust(Command):
                         key_up('down')
                         time.sleep(0.05)
                     counter -= 1
-            error = utils.distance(config.player_pos, self.target)
+            config.capture.wait_for_next(timeout=0.1)      # Position after the step
+            error = utils.distance(utils.predict_player(settings.stop_lag), self.target)
             toggle = not toggle
 
 
@@ -0,0 +1,86 @@
+"""
+Synthetic game frames for benchmarking, built from the template images in assets/.
+Every fixture is generated from a fixed seed, so the same inputs are used on every run.
+"""
+
+import cv2
+import numpy as np
+from src.common import templates
+
+
+# The size of a full frame of the game window
+FRAME_WIDTH = 1366
+FRAME_HEIGHT = 768
+
+# Where the minimap is drawn within each frame
+MINIMAP_TL = (10, 10)
+MINIMAP_BR = (260, 180)
+
+
+def background(height, width, seed=0):
+    """Returns a smooth, noisy BGR image that looks nothing like any template."""
+
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 80, (height // 4, width // 4, 3), dtype=np.uint8)
+    return cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def paste(image, path, x, y):
+    """Draws the image at PATH onto IMAGE with its top-left corner at (X, Y)."""
+
+    icon = cv2.imread(path)
+    height, width = icon.shape[:2]
+    image[y:y+height, x:x+width, :3] = icon
+
+
+def minimap(others=2, rune=True, seed=0):
+    """
+    Returns a BGRA minimap containing the player, OTHERS other players and optionally a rune.
+    :param others:  The number of other players to draw.
+    :param rune:    Whether to draw a rune.
+    :param seed:    The seed of the minimap's background.
+    :return:        The minimap image.
+    """
+
+    width = MINIMAP_BR[0] - MINIMAP_TL[0]
+    height = MINIMAP_BR[1] - MINIMAP_TL[1]
+    image = background(height, width, seed)
+    paste(image, templates.TEMPLATES['player'].path, width // 3, height // 2)
+    if rune:
+        paste(image, templates.TEMPLATES['rune'].path, 2 * width // 3, height // 4)
+    for i in range(others):
+        paste(image, templates.TEMPLATES['other'].path, 20 + 40 * i, 3 * height // 4)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+
+
+def frame(seed=0):
+    """Returns a full BGRA frame with a bordered minimap in its top-left corner."""
+
+    image = background(FRAME_HEIGHT, FRAME_WIDTH, seed)
+    mm = minimap(seed=seed)
+    image[MINIMAP_TL[1]:MINIMAP_BR[1], MINIMAP_TL[0]:MINIMAP_BR[0]] = mm[:, :, :3]
+    paste(image, templates.TEMPLATES['minimap_tl'].path, *MINIMAP_TL)
+    br = cv2.imread(templates.TEMPLATES['minimap_br'].path)
+    paste(image, templates.TEMPLATES['minimap_br'].path,
+          MINIMAP_BR[0] - br.shape[1], MINIMAP_BR[1] - br.shape[0])
+    return cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+
+
+def rune_frame(seed=0, arrows=('left', 'up', 'right', 'down')):
+    """
+    Returns a full BGRA frame showing four orange arrows where a rune's puzzle appears.
+    :param seed:    The seed of the frame's background.
+    :param arrows:  The direction that each arrow points in, from left to right.
+    :return:        The frame image.
+    """
+
+    angles = {'up': 0, 'left': 90, 'down': 180, 'right': 270}
+    image = background(FRAME_HEIGHT, FRAME_WIDTH, seed)
+    y = 220
+    for i, direction in enumerate(arrows):
+        x = FRAME_WIDTH // 2 - 150 + 100 * i
+        arrow = np.array([(0, -30), (30, 0), (12, 0), (12, 30), (-12, 30), (-12, 0), (-30, 0)])
+        rotation = cv2.getRotationMatrix2D((0, 0), angles[direction], 1)[:, :2]
+        points = (arrow @ rotation.T + (x, y)).astype(np.int32)
+        cv2.fillPoly(image, [points], (0, 140, 255))
+    return cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
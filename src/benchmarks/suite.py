@@ -0,0 +1,184 @@
+"""
+Micro-benchmarks for the template matching and color filtering hot paths. Reports how
+many calls of each function complete per second and how much memory a single call
+allocates, then compares both against a stored baseline to catch regressions.
+Run it from the repository root:
+
+    python -m src.benchmarks.suite [--save] [--tolerance 0.2] [--only NAME ...]
+
+Results are also written to bench_output.txt. Exits with status 1 if any benchmark
+regressed. Absolute timings depend on the machine, so each benchmark's speed is
+stored and compared relative to the REFERENCE benchmark, which always runs in the
+same process. A slowdown of the reference itself shows up as every other benchmark
+getting faster.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from src.common import colors, config, templates, utils
+from src.benchmarks import fixtures
+from src.detection import arrows, backends
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+OUTPUT_PATH = 'bench_output.txt'
+
+# The benchmark that every other benchmark's speed is measured relative to
+REFERENCE = 'single_match'
+
+
+class Benchmark:
+    """A function that is called repeatedly with the same arguments."""
+
+    def __init__(self, name, function, *args):
+        self.name = name
+        self.function = function
+        self.args = args
+
+    def run(self, min_time=0.2, repeat=5):
+        """
+        Times this benchmark's function and measures its allocations.
+        :param min_time:    The minimum number of seconds that each timing run lasts.
+        :param repeat:      The number of timing runs, of which the fastest is kept.
+        :return:            A dictionary containing the calls per second and the
+                            peak number of KiB allocated during a single call.
+        """
+
+        self.function(*self.args)       # Warm up any caches
+
+        # Find how many calls take at least MIN_TIME
+        number = 1
+        while self._time(number) < min_time:
+            number *= 2
+        best = min(self._time(number) for _ in range(repeat))
+
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+            self.function(*self.args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            'ops': number / best,
+            'alloc_kib': (peak - start) / 1024
+        }
+
+    def _time(self, number):
+        """Returns how many seconds it takes to call the function NUMBER times."""
+
+        start = time.perf_counter()
+        for _ in range(number):
+            self.function(*self.args)
+        return time.perf_counter() - start
+
+
+def get_benchmarks():
+    """Returns every benchmark whose dependencies are available."""
+
+    frame = fixtures.frame()
+    minimap = fixtures.minimap()
+    rune_box = fixtures.rune_frame()[120:fixtures.FRAME_HEIGHT // 2,
+                                     fixtures.FRAME_WIDTH // 4:3 * fixtures.FRAME_WIDTH // 4]
+    benchmarks = [
+        Benchmark('single_match', utils.single_match, frame, templates.get('minimap_tl')),
+        Benchmark('pyramid_match', utils.pyramid_match, frame, templates.get('minimap_tl')),
+        Benchmark('multi_match', utils.multi_match, minimap, templates.get('player'), 0.8),
+        Benchmark('filter_color minimap', colors.filter_color, minimap, 'other'),
+        Benchmark('filter_color frame', colors.filter_color, frame, 'arrow'),
+        Benchmark('classify_arrows', arrows.classify, rune_box)
+    ]
+
+    try:
+        from src.detection import detection
+        model = detection.Detector()
+    except (ImportError, OSError, backends.BackendError) as e:
+        print(f'\n[!] Skipping merge_detection, the detection model is unavailable: {e}')
+    else:
+        config.enabled = True
+        benchmarks.append(Benchmark('merge_detection', detection.merge_detection,
+                                    model, fixtures.rune_frame(), False))
+    return benchmarks
+
+
+def compare(results, baseline, tolerance):
+    """
+    Formats RESULTS as a table alongside BASELINE.
+    :param results:     A dictionary mapping each benchmark's name to its results.
+    :param baseline:    The results to compare against.
+    :param tolerance:   The fraction by which a result may be worse than its baseline.
+    :return:            The table's lines and the names of the benchmarks that regressed.
+    """
+
+    lines = [f"{'benchmark':<22}{'ops/s':>12}{'relative':>10}{'alloc KiB':>12}"
+             f"{'baseline':>10}{'change':>9}  status"]
+    regressed = []
+    for name, result in results.items():
+        row = f"{name:<22}{result['ops']:>12.1f}{result['relative']:>10.3f}{result['alloc_kib']:>12.1f}"
+        base = baseline.get(name)
+        if name == REFERENCE:
+            lines.append(row + f"{'-':>10}{'-':>9}  reference")
+            continue
+        if base is None:
+            lines.append(row + f"{'-':>10}{'-':>9}  new")
+            continue
+        change = result['relative'] / base['relative'] - 1
+        slower = change < -tolerance
+        heavier = result['alloc_kib'] > base['alloc_kib'] * (1 + tolerance) + 1
+        if slower or heavier:
+            regressed.append(name)
+            status = 'REGRESSED (' + ', '.join(
+                reason for reason, bad in (('slower', slower), ('allocates more', heavier)) if bad
+            ) + ')'
+        else:
+            status = 'ok'
+        lines.append(row + f"{base['relative']:>10.3f}{change:>+9.0%}  {status}")
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the template matching hot paths.')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='the fraction by which a result may be worse than its baseline')
+    parser.add_argument('--only', nargs='+', metavar='NAME', help='only run these benchmarks')
+    args = parser.parse_args()
+
+    results = {}
+    for benchmark in get_benchmarks():
+        if args.only and benchmark.name not in args.only and benchmark.name != REFERENCE:
+            continue
+        results[benchmark.name] = benchmark.run()
+    for result in results.values():
+        result['relative'] = result['ops'] / results[REFERENCE]['ops']
+
+    baseline = {}
+    if os.path.isfile(BASELINE_PATH):
+        with open(BASELINE_PATH) as file:
+            baseline = json.load(file)
+    lines, regressed = compare(results, baseline, args.tolerance)
+    report = '\n'.join(lines)
+    print(report)
+    with open(OUTPUT_PATH, 'w') as file:
+        file.write(report + '\n')
+
+    if args.save:
+        baseline.update({name: {'relative': round(result['relative'], 4),
+                                'alloc_kib': round(result['alloc_kib'], 1)}
+                         for name, result in results.items()})
+        with open(BASELINE_PATH, 'w') as file:
+            json.dump(baseline, file, indent=4)
+            file.write('\n')
+        print(f"\n[~] Saved baseline to '{BASELINE_PATH}'")
+    elif regressed:
+        print(f"\n[!] {len(regressed)} benchmark(s) regressed: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Classifies pixels by color using a lookup table that is indexed directly by their
+BGR values. The table is computed once from HSV ranges, so images never need to be
+converted to HSV and every color class can be found in a single pass.
+"""
+
+import cv2
+import threading
+import numpy as np
+
+
+#################################
+#         Color Ranges          #
+#################################
+# A rune's symbol on the minimap
+RUNE_RANGES = (
+    ((141, 148, 245), (146, 158, 255)),
+)
+
+# Other players' symbols on the minimap
+OTHER_RANGES = (
+    ((0, 245, 215), (10, 255, 255)),
+)
+
+# The orange to green arrows of a rune's puzzle
+ARROW_RANGES = (
+    ((1, 100, 100), (75, 255, 255)),
+)
+
+
+#############################
+#       Color Table         #
+#############################
+class ColorTable:
+    """
+    Maps each of the 2 ** 24 BGR colors to a byte whose bits mark the color classes
+    it belongs to. A color belongs to a class if its HSV value lies within any of
+    that class's ranges, exactly as if it had been filtered with cv2.inRange.
+    """
+
+    def __init__(self, classes):
+        """
+        Creates a new ColorTable. The table itself is only computed once it is first used.
+        :param classes:     A dictionary mapping the name of each color class to a
+                            list of (lower, upper) HSV bounds. At most 8 are allowed.
+        """
+
+        assert len(classes) <= 8, 'A ColorTable can only hold up to 8 color classes'
+        self.classes = classes
+        self.bits = {name: 1 << i for i, name in enumerate(classes)}
+        self.table = None
+        self.lock = threading.Lock()
+
+    def bit(self, name):
+        """Returns the bit that marks color class NAME."""
+
+        return self.bits[name]
+
+    def classify(self, image):
+        """
+        Looks up the color classes of every pixel in IMAGE.
+        :param image:   A BGR or BGRA image.
+        :return:        A uint8 array with the same height and width as IMAGE, where
+                        each pixel holds the bits of the classes it belongs to.
+        """
+
+        table = self._get_table()
+        if image.shape[2] == 4 and image.strides[1:] == (4, 1):
+            # Each BGRA pixel is read as a single little-endian integer, 0xAARRGGBB
+            index = image.view(np.uint32)[..., 0] & 0xFFFFFF
+        else:
+            index = image[..., 2].astype(np.uint32) << 16
+            index |= image[..., 1].astype(np.uint32) << 8
+            index |= image[..., 0]
+        return table.take(index)
+
+    def mask(self, image, name, classes=None):
+        """
+        Finds the pixels in IMAGE that belong to color class NAME.
+        :param image:   A BGR or BGRA image.
+        :param name:    The name of the color class.
+        :param classes: The result of classifying IMAGE, if available.
+        :return:        A uint8 mask that is nonzero wherever IMAGE has a color in NAME.
+        """
+
+        if classes is None:
+            classes = self.classify(image)
+        return np.bitwise_and(classes, self.bits[name])
+
+    def filter(self, image, name, classes=None):
+        """
+        Returns a copy of IMAGE in which every pixel that does not belong to
+        color class NAME is black.
+        :param image:   A BGR or BGRA image.
+        :param name:    The name of the color class.
+        :param classes: The result of classifying IMAGE, if available.
+        :return:        The filtered copy of IMAGE.
+        """
+
+        return cv2.bitwise_and(image, image, mask=self.mask(image, name, classes))
+
+    def _get_table(self):
+        """Returns the lookup table, computing it first if necessary."""
+
+        with self.lock:
+            if self.table is None:
+                self.table = self._build()
+            return self.table
+
+    def _build(self):
+        """Converts every BGR color to HSV, one 256x256 plane of (G, B) values per red value."""
+
+        table = np.empty((256, 256, 256), np.uint8)
+        plane = np.empty((256, 256, 3), np.uint8)
+        plane[..., 0] = np.arange(256, dtype=np.uint8)
+        plane[..., 1] = np.arange(256, dtype=np.uint8)[:, np.newaxis]
+        for red in range(256):
+            plane[..., 2] = red
+            hsv = cv2.cvtColor(plane, cv2.COLOR_BGR2HSV)
+            classes = table[red]
+            classes.fill(0)
+            for name, ranges in self.classes.items():
+                for lower, upper in ranges:
+                    mask = cv2.inRange(hsv, lower, upper)
+                    classes |= mask & self.bits[name]
+        table = table.reshape(-1)
+        table.flags.writeable = False
+        return table
+
+
+TABLE = ColorTable({
+    'rune': RUNE_RANGES,
+    'other': OTHER_RANGES,
+    'arrow': ARROW_RANGES
+})
+
+
+def classify(image):
+    """Looks up the color classes of every pixel in IMAGE using the shared ColorTable."""
+
+    return TABLE.classify(image)
+
+
+def filter_color(image, name, classes=None):
+    """
+    Returns a copy of IMAGE that only contains pixels of color class NAME.
+    :param image:   A BGR or BGRA image.
+    :param name:    The name of a color class in the shared ColorTable.
+    :param classes: The result of classifying IMAGE, if available.
+    :return:        The filtered copy of IMAGE.
+    """
+
+    return TABLE.filter(image, name, classes)
@@ -13,6 +13,12 @@ RESOURCES_DIR = 'resources'
 # The player's position relative to the minimap
 player_pos = (0, 0)
 
+# How well the player's icon matched at PLAYER_POS, from 0 (not found) to 1 (perfect match)
+player_confidence = 0
+
+# The player's filtered position and velocity, as a PlayerState estimated by Capture
+player_state = None
+
 # Describes whether the main bot loop is currently running or not
 enabled = False
 
@@ -0,0 +1,121 @@
+"""Immutable records of the frames that Capture publishes to the other modules."""
+
+import cv2
+import threading
+import numpy as np
+
+
+class Snapshot:
+    """
+    Everything Capture learned during a single iteration. Snapshots are numbered
+    with a monotonically increasing sequence id so that consumers can tell whether
+    they have already seen one. Its images are read-only and must not be modified.
+    The grayscale version of its frame is computed at most once no matter how many
+    consumers ask for it, and is shared by every Snapshot containing the same frame.
+
+    Its attributes cannot be reassigned, but its images are views into Capture's
+    FrameRings and are only valid until their buffers are reused. That happens after
+    6 more full frames or 16 more minimaps have been grabbed, which is under 100 ms at
+    high frame rates. A grayscale frame that is first requested after that point
+    describes a newer grab. Consumers that keep a Snapshot's images for longer than a
+    single step must copy them, or request the grayscale frame straight away.
+    """
+
+    __slots__ = ('seq', 'timestamp', 'frame', 'frame_seq', 'minimap', 'player_pos',
+                 'minimap_state', '_frame_images')
+
+    def __init__(self, seq, timestamp, frame, frame_seq, minimap, player_pos,
+                 minimap_state=None, frame_images=None):
+        """
+        Creates a new Snapshot.
+        :param seq:             This snapshot's sequence id.
+        :param timestamp:       The time at which the minimap was grabbed.
+        :param frame:           The most recent full frame of the game window.
+        :param frame_seq:       The sequence id of the snapshot in which FRAME was grabbed.
+        :param minimap:         The minimap grabbed during this iteration.
+        :param player_pos:      The player's position relative to MINIMAP.
+        :param minimap_state:   The MinimapState describing the icons on MINIMAP.
+        :param frame_images:    The DerivedImages of FRAME, which should be shared by
+                                every Snapshot containing the same frame.
+        """
+
+        for name, value in zip(Snapshot.__slots__, (seq, timestamp, frame, frame_seq,
+                                                    minimap, player_pos, minimap_state)):
+            object.__setattr__(self, name, _read_only(value))
+        if frame_images is None:
+            frame_images = DerivedImages(frame)
+        object.__setattr__(self, '_frame_images', frame_images)
+
+    def gray(self):
+        """Returns the grayscale version of this Snapshot's frame."""
+
+        return self._frame_images.gray()
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Snapshot objects are immutable')
+
+    def __delattr__(self, key):
+        raise AttributeError('Snapshot objects are immutable')
+
+
+class DerivedImages:
+    """Lazily computes and caches other representations of a single BGR(A) image."""
+
+    def __init__(self, image):
+        self.image = image
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def gray(self):
+        return self._get('gray', lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY))
+
+    def _get(self, key, compute):
+        """Returns the representation stored under KEY, computing it first if necessary."""
+
+        with self.lock:
+            if key not in self.cache:
+                self.cache[key] = _read_only(compute())
+            return self.cache[key]
+
+
+class FrameRing:
+    """
+    A fixed number of preallocated image buffers that are written to in turn, which
+    avoids allocating a new array for every grabbed frame. A buffer is overwritten
+    SIZE grabs after it was handed out, so consumers that hold on to an image for
+    longer than that must copy it.
+    """
+
+    def __init__(self, size, channels=4):
+        self.size = size
+        self.channels = channels
+        self.shape = None
+        self.buffers = []
+        self.index = 0
+
+    def next(self, height, width):
+        """
+        Returns the next buffer to write to, reallocating every buffer if the
+        requested dimensions have changed.
+        :param height:  The height of the image that will be written.
+        :param width:   The width of the image that will be written.
+        :return:        A writable uint8 array of shape (HEIGHT, WIDTH, channels).
+        """
+
+        shape = (height, width, self.channels)
+        if shape != self.shape:
+            self.shape = shape
+            self.buffers = [np.empty(shape, np.uint8) for _ in range(self.size)]
+            self.index = 0
+        buffer = self.buffers[self.index]
+        self.index = (self.index + 1) % self.size
+        return buffer
+
+
+def _read_only(value):
+    """Returns a read-only view of VALUE if it is a Numpy array, otherwise VALUE itself."""
+
+    if isinstance(value, np.ndarray):
+        value = value.view()
+        value.flags.writeable = False
+    return value
@@ -0,0 +1,111 @@
+"""Lightweight instrumentation for measuring the stages of a processing loop."""
+
+import time
+import threading
+import numpy as np
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+
+class PipelineStats:
+    """
+    Keeps a rolling window of how long each named stage of a loop took, along with
+    the loop's effective rate and the number of iterations that produced no frame.
+    """
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, window=500):
+        """
+        Creates a new PipelineStats object.
+        :param window:  The number of most recent samples to keep for each stage.
+        """
+
+        self.window = window
+        self.timings = {}
+        self.ticks = deque(maxlen=window)
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage):
+        """Records how long the body of this context manager takes under STAGE."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        """Adds a sample of SECONDS to STAGE."""
+
+        with self.lock:
+            if stage not in self.timings:
+                self.timings[stage] = deque(maxlen=self.window)
+            self.timings[stage].append(seconds)
+
+    def tick(self):
+        """Marks the end of a successful iteration."""
+
+        self.ticks.append(time.perf_counter())
+
+    def drop(self):
+        """Counts an iteration that failed to produce a frame."""
+
+        self.dropped += 1
+
+    def fps(self):
+        """Returns the number of successful iterations per second over the current window."""
+
+        ticks = list(self.ticks)
+        if len(ticks) < 2 or ticks[-1] == ticks[0]:
+            return 0
+        return (len(ticks) - 1) / (ticks[-1] - ticks[0])
+
+    def percentiles(self, stage):
+        """
+        Returns the rolling percentiles of STAGE.
+        :param stage:   The name of the stage.
+        :return:        A dictionary mapping 'p50', 'p95' and 'p99' to milliseconds,
+                        or None if STAGE has no samples.
+        """
+
+        with self.lock:
+            samples = np.array(self.timings.get(stage, ()))
+        if len(samples) == 0:
+            return None
+        values = np.percentile(samples, self.PERCENTILES) * 1000
+        return {f'p{p}': float(v) for p, v in zip(self.PERCENTILES, values)}
+
+    def summary(self):
+        """Returns a dictionary containing the effective rate, dropped count and every stage's percentiles."""
+
+        with self.lock:
+            stages = list(self.timings)
+        return {
+            'fps': self.fps(),
+            'dropped': self.dropped,
+            'stages': {stage: self.percentiles(stage) for stage in stages}
+        }
+
+    def reset(self):
+        """Discards every sample collected so far."""
+
+        with self.lock:
+            self.timings = {}
+            self.ticks.clear()
+            self.dropped = 0
+
+
+def timer(stats, stage):
+    """
+    Times STAGE using STATS, which may be None to skip timing altogether.
+    :param stats:   A PipelineStats object, or None.
+    :param stage:   The name of the stage.
+    :return:        A context manager that times its body.
+    """
+
+    if stats is None:
+        return nullcontext()
+    return stats.time(stage)
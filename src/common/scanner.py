@@ -0,0 +1,218 @@
+"""Finds every icon of interest on the minimap in a single pass over its pixels."""
+
+import cv2
+import numpy as np
+from typing import Dict, NamedTuple, Optional, Tuple
+from src.common import colors, profiling, templates, utils
+
+
+class Icon(NamedTuple):
+    """A kind of minimap icon that is recognized by its color and its template."""
+
+    template: str           # The name of the icon's template in the registry
+    color: str              # The name of the icon's color class in the shared ColorTable
+    threshold: float        # The minimum normalized correlation of a match
+
+
+# Every colored icon that MinimapScanner looks for
+ICONS = {
+    'other': Icon('other', 'other', 0.5),
+    'rune': Icon('rune', 'rune', 0.9)
+}
+
+
+class MinimapState(NamedTuple):
+    """Everything found on a single minimap. Positions are in minimap pixels."""
+
+    timestamp: float
+    player: Optional[Tuple[float, float]]               # Sub-pixel center of the player's icon
+    confidence: float                                   # How well the player's icon matched
+    icons: Dict[str, Tuple[Tuple[int, int], ...]]       # Centers of each kind of icon, best first
+
+    @property
+    def others(self):
+        """Returns the positions of the other players on the minimap."""
+
+        return self.icons.get('other', ())
+
+    @property
+    def rune(self):
+        """Returns the position of the rune, or None if there is no rune on the minimap."""
+
+        runes = self.icons.get('rune', ())
+        return runes[0] if runes else None
+
+
+class Match(NamedTuple):
+    """A single match of an icon's template on the minimap."""
+
+    center: Tuple[int, int]
+    rect: Tuple[int, int, int, int]     # The (left, top, right, bottom) of the matched area
+    score: float
+
+
+class MinimapScanner:
+    """
+    Locates the player and every kind of icon in ICONS on the minimap. Consecutive
+    minimaps usually only differ around the player, so the minimap is divided into
+    tiles and icons are only searched for again near the tiles that changed since
+    the previous scan. Every REFRESH_INTERVAL seconds the whole minimap is searched
+    regardless. Within a search, the color class of every pixel is looked up at once,
+    and each icon's template is only matched within the bounding box of the pixels
+    that have its color, which is usually empty.
+    """
+
+    def __init__(self, tracker, icons=ICONS, scale=1.0, tile_size=16, refresh_interval=1.0,
+                 stats=None):
+        """
+        Creates a new MinimapScanner.
+        :param tracker:             The PlayerTracker that follows the player's icon.
+        :param icons:               A dictionary mapping names to the Icons to look for.
+        :param scale:               The game's UI scale, which determines the size of each template.
+        :param tile_size:           The side length in pixels of each tile that is checked for changes.
+        :param refresh_interval:    Seconds between searches of the entire minimap.
+        :param stats:               An optional PipelineStats object to record stage timings in.
+        """
+
+        self.tracker = tracker
+        self.icons = icons
+        self.scale = scale
+        self.tile_size = tile_size
+        self.refresh_interval = refresh_interval
+        self.stats = stats
+
+        self.previous = None            # A copy of the last scanned minimap
+        self.matches = {}               # The Matches of each icon in the last scanned minimap
+        self.last_refresh = 0
+        self.refresh_scale = None       # The scale at the time of the last full refresh
+
+    def reset(self):
+        """Forgets the last scanned minimap, forcing the next scan to search all of it."""
+
+        self.previous = None
+        self.matches = {}
+
+    def scan(self, minimap, timestamp):
+        """
+        Finds the player and every icon in MINIMAP.
+        :param minimap:     The BGR(A) image of the minimap.
+        :param timestamp:   The time at which MINIMAP was grabbed.
+        :return:            The MinimapState of MINIMAP.
+        """
+
+        player = self.tracker.update(minimap, timestamp)
+        with profiling.timer(self.stats, 'diff'):
+            regions = self._changed_regions(minimap, timestamp)
+        if regions:
+            with profiling.timer(self.stats, 'icons'):
+                self.matches = self._update(minimap, regions)
+        icons = {name: tuple(m.center for m in self.matches.get(name, ())) for name in self.icons}
+        confidence = self.tracker.score if player is not None else 0
+        return MinimapState(timestamp, player, confidence, icons)
+
+    def _changed_regions(self, minimap, timestamp):
+        """
+        Compares MINIMAP with the previously scanned minimap, and remembers it for the next scan.
+        :param minimap:     The BGR(A) image of the minimap.
+        :param timestamp:   The time at which MINIMAP was grabbed.
+        :return:            A list of the (left, top, right, bottom) rectangles that cover
+                            every changed tile, which is the whole minimap on a refresh.
+        """
+
+        height, width = minimap.shape[:2]
+        if self.previous is None or self.previous.shape != minimap.shape \
+                or self.scale != self.refresh_scale \
+                or timestamp - self.last_refresh >= self.refresh_interval:
+            self.previous = minimap.copy()
+            self.last_refresh = timestamp
+            self.refresh_scale = self.scale
+            return [(0, 0, width, height)]
+
+        # Find the tiles that contain at least one changed pixel
+        size = self.tile_size
+        if minimap.shape[2] == 4 and minimap.strides[1:] == (4, 1):
+            changed = minimap.view(np.uint32)[..., 0] != self.previous.view(np.uint32)[..., 0]
+        else:
+            changed = (minimap != self.previous).any(axis=2)
+        dirty = np.logical_or.reduceat(changed, np.arange(0, height, size), axis=0)
+        dirty = np.logical_or.reduceat(dirty, np.arange(0, width, size), axis=1)
+        if not dirty.any():
+            return []
+        np.copyto(self.previous, minimap)
+
+        # Group neighboring dirty tiles into rectangles
+        _, _, rects, _ = cv2.connectedComponentsWithStats(dirty.view(np.uint8), connectivity=8)
+        return [(x * size, y * size, min(width, (x + w) * size), min(height, (y + h) * size))
+                for x, y, w, h, _ in rects[1:]]
+
+    def _update(self, minimap, regions):
+        """
+        Searches for every icon near REGIONS of MINIMAP, and keeps the previous
+        matches that lie entirely outside of them.
+        :param minimap:     The BGR(A) image of the minimap.
+        :param regions:     The rectangles of MINIMAP that have changed.
+        :return:            A dictionary mapping the name of each icon to its Matches.
+        """
+
+        height, width = minimap.shape[:2]
+        matches = {
+            name: [m for m in self.matches.get(name, ())
+                   if not any(_overlaps(m.rect, r) for r in regions)]
+            for name in self.icons
+        }
+        found = {name: {m.rect for m in matches[name]} for name in self.icons}
+        sizes = [templates.get(icon.template, self.scale).shape for icon in self.icons.values()]
+        pad_y = max(h for h, _ in sizes) - 1
+        pad_x = max(w for _, w in sizes) - 1
+        for region in regions:
+            # Search every position at which a template would overlap REGION
+            left = max(0, region[0] - pad_x)
+            top = max(0, region[1] - pad_y)
+            right = min(width, region[2] + pad_x)
+            bottom = min(height, region[3] + pad_y)
+            image = minimap[top:bottom, left:right]
+            classes = colors.classify(image)
+            for name, icon in self.icons.items():
+                for match in self._find(image, classes, icon, left, top):
+                    if _overlaps(match.rect, region) and match.rect not in found[name]:
+                        found[name].add(match.rect)
+                        matches[name].append(match)
+        for name in matches:
+            matches[name].sort(key=lambda m: (-m.score, m.rect[1], m.rect[0]))
+        return matches
+
+    def _find(self, image, classes, icon, left, top):
+        """
+        Returns the Matches of ICON in IMAGE, given its color CLASSES. IMAGE is
+        offset from the top-left corner of the minimap by (LEFT, TOP).
+        """
+
+        mask = colors.TABLE.mask(image, icon.color, classes)
+        points = np.argwhere(mask)
+        if len(points) == 0:
+            return []
+
+        # Only match where the template could overlap a pixel of the right color
+        template = templates.get(icon.template, self.scale)
+        t_height, t_width = template.shape
+        y0, x0 = np.maximum(points.min(axis=0) - (t_height - 1, t_width - 1), 0)
+        y1, x1 = points.max(axis=0) + (t_height, t_width)
+        region = (slice(y0, y1), slice(x0, x1))
+        filtered = colors.filter_color(image[region], icon.color, classes[region])
+        if filtered.shape[0] < t_height or filtered.shape[1] < t_width:
+            return []
+        result = cv2.matchTemplate(utils.to_gray(filtered), template, cv2.TM_CCOEFF_NORMED)
+        locations, scores = utils.find_peaks(result, icon.threshold, template.shape)
+        matches = []
+        for (x, y), score in zip(locations.tolist(), scores.tolist()):
+            x += int(x0) + left
+            y += int(y0) + top
+            center = (round(x + t_width / 2), round(y + t_height / 2))
+            matches.append(Match(center, (x, y, x + t_width, y + t_height), score))
+        return matches
+
+
+def _overlaps(a, b):
+    """Returns whether the (left, top, right, bottom) rectangles A and B intersect."""
+
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
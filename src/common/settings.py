@@ -69,19 +69,28 @@ def validate_horizontal_arrows(key):
 SETTING_VALIDATORS = {
     'move_tolerance': float,
     'adjust_tolerance': float,
+    'stop_lag': float,
     'record_layout': validate_boolean,
-    'buff_cooldown': validate_nonnegative_int
+    'buff_cooldown': validate_nonnegative_int,
+    'min_fps': validate_nonnegative_int,
+    'idle_fps': validate_nonnegative_int,
+    'max_fps': validate_nonnegative_int
 }
 
 
 def reset():
     """Resets all settings to their default values."""
 
-    global move_tolerance, adjust_tolerance, record_layout, buff_cooldown
+    global move_tolerance, adjust_tolerance, stop_lag, record_layout, buff_cooldown
+    global min_fps, idle_fps, max_fps
     move_tolerance = 0.1
     adjust_tolerance = 0.01
+    stop_lag = 0.08
     record_layout = False
     buff_cooldown = 180
+    min_fps = 10
+    idle_fps = 30
+    max_fps = 200
 
 
 # The allowed error from the destination when moving towards a Point
@@ -90,10 +99,22 @@ move_tolerance = 0.1
 # The allowed error from a specific location while adjusting to that location
 adjust_tolerance = 0.01
 
+# The amount of time (in seconds) that the player keeps moving after releasing a movement key
+stop_lag = 0.08
+
 # Whether the bot should save new player positions to the current layout
 record_layout = False
 
 # The amount of time (in seconds) to wait between each call to the 'buff' command
 buff_cooldown = 180
 
+# The screen capture rate while the bot is disabled
+min_fps = 10
+
+# The screen capture rate while the bot is enabled but nothing is waiting on new frames
+idle_fps = 30
+
+# The screen capture rate while the bot is waiting on new frames
+max_fps = 200
+
 reset()
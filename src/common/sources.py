@@ -0,0 +1,300 @@
+"""Interchangeable sources of game frames that can be consumed by Capture."""
+
+import os
+import cv2
+import threading
+import numpy as np
+
+try:
+    import ctypes
+    import mss
+    import mss.windows
+    from ctypes import wintypes
+    user32 = ctypes.windll.user32
+    user32.SetProcessDPIAware()
+except (AttributeError, ImportError):       # Live capture is only available on Windows
+    user32 = None
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp'}
+
+
+class SourceError(Exception):
+    """Raised by a FrameSource when a frame could not be grabbed."""
+
+
+class FrameSource:
+    """
+    Supplies Capture with frames. Frames are BGRA Numpy arrays, which is the format
+    produced by mss. Subclasses must override LOCATE and GRAB.
+    """
+
+    paced = True        # Whether Capture's RateGovernor should limit how often it is grabbed
+
+    def __init__(self):
+        self.finished = False       # Set once the source has no more frames to give
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        """Acquires any resources needed to grab frames."""
+
+    def close(self):
+        """Releases the resources acquired by OPEN."""
+
+    def locate(self):
+        """
+        Finds the game window.
+        :return:    The window's (left, top, right, bottom) coordinates on the screen.
+        """
+
+        raise NotImplementedError
+
+    def grab(self, region):
+        """
+        Grabs the pixels inside REGION.
+        :param region:  A dictionary with the keys 'left', 'top', 'width' and 'height'.
+        :return:        The grabbed BGRA image, or None if no frame is available.
+        """
+
+        raise NotImplementedError
+
+    def grab_into(self, region, out):
+        """
+        Grabs the pixels inside REGION directly into the preallocated image OUT.
+        :param region:  A dictionary with the keys 'left', 'top', 'width' and 'height'.
+        :param out:     A writable BGRA array that is at least as large as REGION.
+        :return:        The part of OUT that was written to, or None if no frame is available.
+        """
+
+        image = self.grab(region)
+        if image is None:
+            return None
+        return _copy_into(image, out)
+
+
+class MssSource(FrameSource):
+    """Grabs frames from a live game window using mss."""
+
+    def __init__(self, title='MapleStory', handle=None):
+        """
+        Creates a new MssSource.
+        :param title:   The title of the game window.
+        :param handle:  The handle of a specific game window, used to tell apart
+                        several windows that share the same TITLE.
+        """
+
+        super().__init__()
+        if user32 is None:
+            raise SourceError('Live screen capture is only supported on Windows')
+        self.title = title
+        self.handle = handle
+        self.local = threading.local()      # mss keeps its GDI handles per thread
+        self.instances = []                 # Every mss instance, so that CLOSE can release them
+        self.lock = threading.Lock()
+
+    def open(self):
+        mss.windows.CAPTUREBLT = 0
+
+    def close(self):
+        with self.lock:
+            for sct in self.instances:
+                sct.close()
+            self.instances = []
+        self.local = threading.local()
+
+    def locate(self):
+        handle = self.handle
+        if handle is None:
+            handle = user32.FindWindowW(None, self.title)
+        rect = wintypes.RECT()
+        user32.GetWindowRect(handle, ctypes.pointer(rect))
+        rect = (rect.left, rect.top, rect.right, rect.bottom)
+        return tuple(max(0, x) for x in rect)
+
+    def grab(self, region):
+        return np.array(self._grab(region))
+
+    def grab_into(self, region, out):
+        shot = self._grab(region)
+        pixels = np.frombuffer(shot.raw, np.uint8).reshape(shot.height, shot.width, 4)
+        return _copy_into(pixels, out)
+
+    def _grab(self, region):
+        """
+        Returns the raw mss screenshot of REGION. Each thread that grabs gets its own
+        mss instance, since one cannot be used from a thread other than its creator's.
+        """
+
+        sct = getattr(self.local, 'sct', None)
+        if sct is None:
+            sct = self.local.sct = mss.mss()
+            with self.lock:
+                self.instances.append(sct)
+        try:
+            return sct.grab(region)
+        except mss.exception.ScreenShotError as e:
+            raise SourceError(str(e))
+
+
+class ReplaySource(FrameSource):
+    """
+    Base class for sources that replay previously recorded frames as fast as they
+    are requested. Every call to GRAB advances to the next recorded frame. Subclasses
+    must override _READ and, if LOOP is supported, _REWIND.
+    """
+
+    paced = False
+
+    def __init__(self, loop=False):
+        super().__init__()
+        self.loop = loop
+        self.current = None
+
+    def open(self):
+        self.finished = False
+        self.current = self._next()
+        if self.current is None:
+            raise SourceError(f'{self.__class__.__name__} does not contain any frames')
+
+    def locate(self):
+        height, width = self.current.shape[:2]
+        return 0, 0, width, height
+
+    def grab(self, region):
+        frame = self.current
+        if frame is None:
+            return None
+        self.current = self._next()
+        left, top = region['left'], region['top']
+        return frame[top:top+region['height'], left:left+region['width']]
+
+    def _next(self):
+        """Returns the next frame as a BGRA image, rewinding at the end if looping."""
+
+        frame = self._read()
+        if frame is None and self.loop:
+            self._rewind()
+            frame = self._read()
+        if frame is None:
+            self.finished = True
+            return None
+        if frame.ndim == 2:
+            return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGRA)
+        if frame.shape[2] == 3:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+        return frame
+
+    def _read(self):
+        """Returns the next recorded frame, or None if there are no frames left."""
+
+        raise NotImplementedError
+
+    def _rewind(self):
+        """Resets this source to its first frame."""
+
+        raise NotImplementedError
+
+
+class ImageDirectorySource(ReplaySource):
+    """Replays the images inside a directory in alphabetical order."""
+
+    def __init__(self, directory, loop=False):
+        super().__init__(loop=loop)
+        self.paths = sorted(os.path.join(directory, f) for f in os.listdir(directory)
+                            if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS)
+        self.index = 0
+
+    def _read(self):
+        while self.index < len(self.paths):
+            frame = cv2.imread(self.paths[self.index], cv2.IMREAD_UNCHANGED)
+            self.index += 1
+            if frame is not None:
+                return frame
+            print(f"\n[!] Skipping unreadable image '{self.paths[self.index - 1]}'")
+
+    def _rewind(self):
+        self.index = 0
+
+
+class VideoSource(ReplaySource):
+    """Replays the frames of a video file."""
+
+    def __init__(self, path, loop=False):
+        super().__init__(loop=loop)
+        self.path = path
+        self.video = None
+
+    def open(self):
+        self.video = cv2.VideoCapture(self.path)
+        if not self.video.isOpened():
+            raise SourceError(f"Unable to open video '{self.path}'")
+        super().open()
+
+    def close(self):
+        if self.video is not None:
+            self.video.release()
+            self.video = None
+
+    def _read(self):
+        success, frame = self.video.read()
+        return frame if success else None
+
+    def _rewind(self):
+        self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+
+class MemorySource(ReplaySource):
+    """Replays a sequence of frames that are already loaded in memory."""
+
+    def __init__(self, frames, loop=True):
+        super().__init__(loop=loop)
+        self.frames = list(frames)
+        self.index = 0
+
+    def _read(self):
+        if self.index < len(self.frames):
+            frame = self.frames[self.index]
+            self.index += 1
+            return frame
+
+    def _rewind(self):
+        self.index = 0
+
+
+def find_windows(title='MapleStory'):
+    """
+    Finds every visible top-level window named TITLE.
+    :param title:   The window title to look for.
+    :return:        A list of window handles.
+    """
+
+    if user32 is None:
+        raise SourceError('Live screen capture is only supported on Windows')
+
+    handles = []
+
+    @ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+    def callback(handle, _):
+        length = user32.GetWindowTextLengthW(handle)
+        buffer = ctypes.create_unicode_buffer(length + 1)
+        user32.GetWindowTextW(handle, buffer, length + 1)
+        if buffer.value == title and user32.IsWindowVisible(handle):
+            handles.append(handle)
+        return True
+
+    user32.EnumWindows(callback, 0)
+    return handles
+
+
+def _copy_into(image, out):
+    """Copies IMAGE into the top-left corner of OUT and returns the written part of OUT."""
+
+    height, width = image.shape[:2]
+    out = out[:height, :width]
+    np.copyto(out, image)
+    return out
@@ -0,0 +1,140 @@
+"""
+A registry of every template image used for matching. Templates are only loaded and
+preprocessed the first time they are needed, and are then cached for each scale.
+The registry's scale follows the game's UI scale, which is determined by Capture
+during calibration, so that the same assets work at any client resolution.
+"""
+
+import threading
+import cv2
+from src.common import colors, utils
+
+
+# The UI scales that are tried when the templates do not match at the current scale
+SCALES = (1.0, 0.9, 0.8, 0.75, 0.7, 0.6, 0.5)
+
+
+#############################
+#       Template Class      #
+#############################
+class Template:
+    """A grayscale template that is loaded, color-filtered and rescaled on demand."""
+
+    def __init__(self, path, color=None):
+        """
+        Creates a new Template.
+        :param path:    The path to the template's image file.
+        :param color:   The color class that the template is filtered by before being
+                        converted to grayscale, or None to use the image as-is.
+        """
+
+        self.path = path
+        self.color = color
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def get(self, scale=1.0):
+        """
+        Returns this template resized by SCALE, preprocessing it first if necessary.
+        :param scale:   The factor by which to resize the original image.
+        :return:        The preprocessed grayscale template.
+        """
+
+        with self.lock:
+            if scale not in self.cache:
+                if 1.0 not in self.cache:
+                    self.cache[1.0] = self._load()
+                self.cache[scale] = _resize(self.cache[1.0], scale)
+            return self.cache[scale]
+
+    def _load(self):
+        """Reads and preprocesses the original template image."""
+
+        if self.color is None:
+            image = cv2.imread(self.path, cv2.IMREAD_GRAYSCALE)
+        else:
+            image = cv2.imread(self.path)
+        if image is None:
+            raise FileNotFoundError(f"Unable to load template '{self.path}'")
+        if self.color is not None:
+            image = cv2.cvtColor(colors.filter_color(image, self.color), cv2.COLOR_BGR2GRAY)
+        image.flags.writeable = False
+        return image
+
+
+def _resize(image, scale):
+    """Returns a read-only copy of IMAGE resized by SCALE."""
+
+    if scale == 1.0:
+        return image
+    height, width = image.shape
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    resized = cv2.resize(image, size, interpolation=interpolation)
+    resized.flags.writeable = False
+    return resized
+
+
+#########################
+#       Registry        #
+#########################
+TEMPLATES = {
+    'minimap_tl': Template('assets/minimap_tl_template.png'),
+    'minimap_br': Template('assets/minimap_br_template.png'),
+    'player': Template('assets/player_template.png'),
+    'rune': Template('assets/rune_template.png', color='rune'),
+    'other': Template('assets/other_template.png', color='other'),
+    'elite': Template('assets/elite_template.jpg'),
+    'rune_buff': Template('assets/rune_buff_template.jpg')
+}
+
+
+# The game's UI scale relative to the resolution at which the assets were captured
+current_scale = 1.0
+
+
+def get(name, scale=None):
+    """
+    Returns the preprocessed template registered under NAME.
+    :param name:    The name of the template.
+    :param scale:   The factor by which to resize the original template, defaults
+                    to the registry's current scale.
+    :return:        The grayscale template as a read-only Numpy array.
+    """
+
+    if scale is None:
+        scale = current_scale
+    return TEMPLATES[name].get(scale)
+
+
+def set_scale(scale):
+    """Makes SCALE the default scale of every template in the registry."""
+
+    global current_scale
+    current_scale = scale
+
+
+def detect_scale(frame, names, scales=SCALES):
+    """
+    Finds the scale at which the templates in NAMES best match FRAME.
+    :param frame:   The BGR(A) or grayscale image to search.
+    :param names:   The names of templates that are expected to appear in FRAME.
+    :param scales:  The candidate scales.
+    :return:        The best scale and its average normalized correlation.
+    """
+
+    gray = utils.to_gray(frame)
+    best_scale, best_score = 1.0, -1
+    for scale in scales:
+        scores = []
+        for name in names:
+            template = get(name, scale)
+            if template.shape[0] > gray.shape[0] or template.shape[1] > gray.shape[1]:
+                break
+            result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+            scores.append(cv2.minMaxLoc(result)[1])
+        else:
+            score = sum(scores) / len(scores)
+            if score > best_score:
+                best_scale, best_score = scale, score
+    return best_scale, best_score
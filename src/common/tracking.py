@@ -0,0 +1,207 @@
+"""Classes that follow the player's icon on the minimap from frame to frame."""
+
+import cv2
+import numpy as np
+from typing import NamedTuple, Tuple
+from src.common import profiling, utils
+
+
+class PlayerTracker:
+    """
+    Locates the player's icon on the minimap. Searches a small window around the
+    position predicted from the previous two sightings, and only falls back to
+    matching against the entire minimap when the icon is lost.
+    """
+
+    def __init__(self, template, threshold=0.8, margin=6, max_speed=300, stats=None):
+        """
+        Creates a new PlayerTracker that looks for TEMPLATE.
+        :param template:    The grayscale image of the player's icon.
+        :param threshold:   The minimum normalized correlation that counts as a sighting.
+        :param margin:      Extra pixels to search on each side of the predicted position.
+        :param max_speed:   The fastest plausible movement in minimap pixels per second.
+        :param stats:       An optional PipelineStats object to record stage timings in.
+        """
+
+        self.template = template
+        self.threshold = threshold
+        self.margin = margin
+        self.max_speed = max_speed
+        self.stats = stats
+
+        self.pos = None             # Center of the icon in minimap pixels
+        self.velocity = (0, 0)      # Minimap pixels per second
+        self.timestamp = 0
+        self.score = 0              # Normalized correlation of the last sighting
+
+    def reset(self):
+        """Forgets the player's last position, forcing the next update to do a full search."""
+
+        self.pos = None
+        self.velocity = (0, 0)
+        self.score = 0
+
+    def update(self, minimap, timestamp):
+        """
+        Finds the player in MINIMAP.
+        :param minimap:     The BGR(A) image of the minimap.
+        :param timestamp:   The time at which MINIMAP was grabbed.
+        :return:            The center of the player's icon with sub-pixel precision,
+                            or None if the player could not be found.
+        """
+
+        pos = None
+        if self.pos is not None:
+            pos = self._search_near(minimap, timestamp)
+        if pos is None:
+            pos = self._search(minimap, 0, 0)
+
+        if pos is None:
+            self.reset()
+        else:
+            if self.pos is not None and timestamp > self.timestamp:
+                dt = timestamp - self.timestamp
+                self.velocity = tuple(
+                    max(-self.max_speed, min(self.max_speed, (pos[i] - self.pos[i]) / dt))
+                    for i in range(2)
+                )
+            self.pos = pos
+            self.timestamp = timestamp
+        return pos
+
+    def _search_near(self, minimap, timestamp):
+        """Searches the window around the player's predicted position."""
+
+        dt = max(0, timestamp - self.timestamp)
+        t_height, t_width = self.template.shape
+        m_height, m_width = minimap.shape[:2]
+        x = self.pos[0] + self.velocity[0] * dt
+        y = self.pos[1] + self.velocity[1] * dt
+        reach_x = t_width / 2 + self.margin + abs(self.velocity[0]) * dt / 2
+        reach_y = t_height / 2 + self.margin + abs(self.velocity[1]) * dt / 2
+        left = max(0, int(x - reach_x))
+        top = max(0, int(y - reach_y))
+        right = min(m_width, int(x + reach_x) + 1)
+        bottom = min(m_height, int(y + reach_y) + 1)
+        return self._search(minimap[top:bottom, left:right], left, top)
+
+    def _search(self, image, left, top):
+        """
+        Matches the template against IMAGE, which is offset from the top-left
+        corner of the minimap by (LEFT, TOP).
+        """
+
+        t_height, t_width = self.template.shape
+        if image.shape[0] < t_height or image.shape[1] < t_width:
+            return None
+        with profiling.timer(self.stats, 'gray'):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        with profiling.timer(self.stats, 'match'):
+            result = cv2.matchTemplate(gray, self.template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, loc = cv2.minMaxLoc(result)
+        if score < self.threshold:
+            return None
+        self.score = min(1.0, score)
+        x, y = utils.subpixel_peak(result, loc)
+        return left + x + t_width / 2, top + y + t_height / 2
+
+
+class PlayerState(NamedTuple):
+    """The filtered position and velocity of the player at a single point in time."""
+
+    timestamp: float
+    pos: Tuple[float, float]
+    velocity: Tuple[float, float]       # Units of POS per second
+
+    def predict(self, t, limit=None):
+        """
+        Extrapolates the player's position to time T, assuming constant velocity.
+        :param t:       The time at which to predict the player's position.
+        :param limit:   The most seconds past TIMESTAMP to extrapolate, defaults to
+                        PREDICTION_LIMIT.
+        :return:        The predicted position.
+        """
+
+        if limit is None:
+            limit = PREDICTION_LIMIT
+        dt = min(max(0, t - self.timestamp), limit)
+        return tuple(p + v * dt for p, v in zip(self.pos, self.velocity))
+
+
+# The furthest into the future that a PlayerState will extrapolate, in seconds
+PREDICTION_LIMIT = 0.5
+
+
+class PlayerFilter:
+    """
+    A constant-velocity Kalman filter that smooths the player's measured positions
+    and estimates their velocity. Both axes are filtered independently. Jumps that
+    are too large to be noise, such as teleports, restart the filter.
+    """
+
+    def __init__(self, measurement_noise=0.002, acceleration_noise=2.0, gate=0.05, max_gap=0.5):
+        """
+        Creates a new PlayerFilter.
+        :param measurement_noise:   The standard deviation of a measured position.
+        :param acceleration_noise:  The standard deviation of the player's acceleration,
+                                    in units of position per second squared.
+        :param gate:                The largest difference between a measurement and its
+                                    prediction that is not treated as a teleport.
+        :param max_gap:             The most seconds between measurements before restarting.
+        """
+
+        self.measurement_noise = measurement_noise
+        self.acceleration_noise = acceleration_noise
+        self.gate = gate
+        self.max_gap = max_gap
+
+        self.state = None           # The latest PlayerState
+        self.x = None               # The [position, velocity] of each axis
+        self.p = None               # The 2x2 covariance of each axis's X
+
+    def reset(self):
+        """Forgets every previous measurement."""
+
+        self.state = None
+        self.x = None
+        self.p = None
+
+    def update(self, pos, timestamp, confidence=1.0):
+        """
+        Adds a measurement of the player's position.
+        :param pos:         The measured position.
+        :param timestamp:   The time at which POS was measured.
+        :param confidence:  How reliable POS is, from 0 to 1. Less reliable
+                            measurements move the estimate less.
+        :return:            The updated PlayerState.
+        """
+
+        z = np.asarray(pos, float)
+        r = (self.measurement_noise / max(0.1, confidence)) ** 2
+        dt = 0 if self.state is None else timestamp - self.state.timestamp
+        if self.state is None or not 0 <= dt <= self.max_gap:
+            self._restart(z, r)
+        else:
+            # Predict the state at TIMESTAMP
+            f = np.array([[1, dt], [0, 1]])
+            q = self.acceleration_noise ** 2 * np.array([[dt ** 4 / 4, dt ** 3 / 2],
+                                                         [dt ** 3 / 2, dt ** 2]])
+            x = self.x @ f.T
+            p = f @ self.p @ f.T + q
+
+            # Correct it using the measurement
+            innovation = z - x[:, 0]
+            if np.any(np.abs(innovation) > self.gate):
+                self._restart(z, r)
+            else:
+                gain = p[:, :, 0] / (p[:, 0, 0] + r)[:, np.newaxis]
+                self.x = x + gain * innovation[:, np.newaxis]
+                self.p = p - gain[:, :, np.newaxis] * p[:, np.newaxis, 0, :]
+        self.state = PlayerState(timestamp, tuple(self.x[:, 0].tolist()), tuple(self.x[:, 1].tolist()))
+        return self.state
+
+    def _restart(self, z, r):
+        """Starts filtering again from the measured position Z, which has variance R."""
+
+        self.x = np.stack((z, np.zeros(2)), axis=1)
+        self.p = np.tile(np.diag([r, 0.25]), (2, 1, 1))
@@ -1,6 +1,7 @@
 """A collection of functions and classes used across multiple modules."""
 
 import math
+import time
 import queue
 import cv2
 import threading
@@ -9,6 +10,13 @@ from src.common import config, settings
 from random import random
 
 
+# The smallest side length that a template is downscaled to by pyramid_match
+PYRAMID_MIN_SIZE = 4
+
+# The oldest, in seconds, that the filtered player state can be before it is ignored
+PLAYER_STATE_MAX_AGE = 0.1
+
+
 def run_if_enabled(function):
     """
     Decorator for functions that should only run if the bot is enabled.
@@ -72,15 +80,23 @@ def separate_args(arguments):
     return args, kwargs
 
 
+def to_gray(image):
+    """Returns IMAGE converted to grayscale, or IMAGE itself if it already is."""
+
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
 def single_match(frame, template):
     """
     Finds the best match within FRAME.
-    :param frame:       The image in which to search for TEMPLATE.
+    :param frame:       The BGR(A) or grayscale image in which to search for TEMPLATE.
     :param template:    The template to match with.
     :return:            The top-left and bottom-right positions of the best match.
     """
 
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    gray = to_gray(frame)
     result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF)
     _, _, _, top_left = cv2.minMaxLoc(result)
     w, h = template.shape[::-1]
@@ -88,41 +104,203 @@ def single_match(frame, template):
     return top_left, bottom_right
 
 
+def pyramid_match(frame, template, method=cv2.TM_CCOEFF_NORMED, levels=2, candidates=4):
+    """
+    Finds the best match within FRAME by first searching copies of FRAME and TEMPLATE
+    that are downscaled by a factor of 2 ** LEVELS, and then only searching the areas
+    around the most promising CANDIDATES at full resolution.
+    :param frame:       The BGR(A) or grayscale image in which to search for TEMPLATE.
+    :param template:    The template to match with.
+    :param method:      The cv2.matchTemplate comparison method, where higher is better.
+    :param levels:      The maximum number of times to halve FRAME and TEMPLATE.
+    :param candidates:  The number of coarse matches to refine at full resolution.
+    :return:            The top-left position of the best match and its score.
+    """
+
+    gray = to_gray(frame)
+    h, w = template.shape
+    if h > gray.shape[0] or w > gray.shape[1]:
+        return (0, 0), float('-inf')
+    while levels > 0 and min(h, w) >> levels < PYRAMID_MIN_SIZE:
+        levels -= 1
+    if levels == 0:
+        result = cv2.matchTemplate(gray, template, method)
+        _, score, _, top_left = cv2.minMaxLoc(result)
+        return top_left, score
+
+    # Search the downscaled images for candidate locations
+    small_frame, small_template = gray, template
+    for _ in range(levels):
+        small_frame = cv2.pyrDown(small_frame)
+        small_template = cv2.pyrDown(small_template)
+    coarse = cv2.matchTemplate(small_frame, small_template, method)
+    locations = []
+    s_h, s_w = small_template.shape
+    for _ in range(candidates):
+        _, _, _, (x, y) = cv2.minMaxLoc(coarse)
+        locations.append((x, y))
+        coarse[max(0, y - s_h // 2):y + s_h // 2 + 1,
+               max(0, x - s_w // 2):x + s_w // 2 + 1] = -np.inf
+
+    # Refine each candidate at full resolution
+    # Thin lines blur away when downscaled, so coarse peaks can be a few pixels off
+    factor = 2 ** levels
+    margin = 4 * factor
+    best_loc, best_score = (0, 0), float('-inf')
+    for x, y in locations:
+        left = max(0, x * factor - margin)
+        top = max(0, y * factor - margin)
+        region = gray[top:y * factor + h + margin, left:x * factor + w + margin]
+        if region.shape[0] < h or region.shape[1] < w:
+            continue
+        result = cv2.matchTemplate(region, template, method)
+        _, score, _, loc = cv2.minMaxLoc(result)
+        if score > best_score:
+            best_loc, best_score = (left + loc[0], top + loc[1]), score
+    return best_loc, best_score
+
+
+def match_score(frame, template, top_left, margin=2):
+    """
+    Checks how well TEMPLATE matches FRAME at a known location.
+    :param frame:       The image in which to check for TEMPLATE.
+    :param template:    The template to match with.
+    :param top_left:    Where the top-left corner of TEMPLATE is expected to be in FRAME.
+    :param margin:      The number of pixels that the match is allowed to be off by.
+    :return:            The best normalized correlation near TOP_LEFT, 0 if out of bounds.
+    """
+
+    h, w = template.shape
+    left = max(0, top_left[0] - margin)
+    top = max(0, top_left[1] - margin)
+    region = frame[top:top_left[1] + h + margin, left:top_left[0] + w + margin]
+    if region.shape[0] < h or region.shape[1] < w:
+        return 0
+    gray = to_gray(region)
+    result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+    return cv2.minMaxLoc(result)[1]
+
+
 def multi_match(frame, template, threshold=0.95):
     """
     Finds all matches in FRAME that are similar to TEMPLATE by at least THRESHOLD.
-    :param frame:       The image in which to search.
+    :param frame:       The BGR(A) or grayscale image in which to search.
+    :param template:    The template to match with.
+    :param threshold:   The minimum percentage of TEMPLATE that each result must match.
+    :return:            An array of matches that exceed THRESHOLD, best match first.
+    """
+
+    points, _ = match_peaks(frame, template, threshold=threshold)
+    return [tuple(p) for p in points.tolist()]
+
+
+def match_peaks(frame, template, threshold=0.95):
+    """
+    Finds every distinct occurrence of TEMPLATE in FRAME. Each occurrence yields a
+    single result, even though neighboring pixels usually also exceed THRESHOLD.
+    :param frame:       The BGR(A) or grayscale image in which to search.
     :param template:    The template to match with.
     :param threshold:   The minimum percentage of TEMPLATE that each result must match.
-    :return:            An array of matches that exceed THRESHOLD.
+    :return:            An (N, 2) integer array of the centers of each match and an
+                        array of their N scores, both sorted from best to worst.
     """
 
     if template.shape[0] > frame.shape[0] or template.shape[1] > frame.shape[1]:
-        return []
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return np.empty((0, 2), np.int64), np.empty(0, np.float32)
+    gray = to_gray(frame)
     result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
-    locations = np.where(result >= threshold)
-    locations = list(zip(*locations[::-1]))
-    results = []
-    for p in locations:
-        x = int(round(p[0] + template.shape[1] / 2))
-        y = int(round(p[1] + template.shape[0] / 2))
-        results.append((x, y))
-    return results
+    locations, scores = find_peaks(result, threshold, template.shape)
+    h, w = template.shape
+    centers = np.round(locations + (w / 2, h / 2)).astype(np.int64)
+    return centers, scores
 
 
-def convert_to_relative(point, frame):
+def find_peaks(result, threshold, size):
+    """
+    Applies non-maximum suppression to a template matching RESULT.
+    :param result:      The correlation surface returned by cv2.matchTemplate.
+    :param threshold:   The minimum score of a peak.
+    :param size:        The (height, width) of the template. Peaks closer than
+                        this to a better peak are suppressed.
+    :return:            An (N, 2) array of the (x, y) locations of each peak within
+                        RESULT and an array of their N scores, sorted from best to worst.
+    """
+
+    h, w = size
+    dilated = cv2.dilate(result, np.ones((h, w), np.uint8))
+    ys, xs = np.nonzero((result >= threshold) & (result >= dilated))
+    scores = result[ys, xs]
+    order = np.argsort(-scores, kind='stable')
+    xs, ys, scores = xs[order], ys[order], scores[order]
+
+    # Dilation leaves every point of a plateau, so only keep the first of each
+    keep = np.ones(len(xs), bool)
+    for i in range(len(xs)):
+        if keep[i]:
+            close = (np.abs(xs[i+1:] - xs[i]) < w) & (np.abs(ys[i+1:] - ys[i]) < h)
+            keep[i+1:] &= ~close
+    return np.stack((xs[keep], ys[keep]), axis=1), scores[keep]
+
+
+def subpixel_peak(result, loc):
+    """
+    Refines the integer peak LOC of a template matching RESULT by fitting a parabola
+    through the peak and its horizontal and vertical neighbors.
+    :param result:  The correlation surface returned by cv2.matchTemplate.
+    :param loc:     The (x, y) location of the peak within RESULT.
+    :return:        The peak's (x, y) location with sub-pixel precision.
+    """
+
+    def offset(left, center, right):
+        denominator = left - 2 * center + right
+        if denominator >= 0:        # Not a maximum, cannot be refined
+            return 0
+        return max(-0.5, min(0.5, 0.5 * (left - right) / denominator))
+
+    x, y = loc
+    height, width = result.shape
+    d_x = d_y = 0
+    if 0 < x < width - 1:
+        d_x = offset(result[y, x - 1], result[y, x], result[y, x + 1])
+    if 0 < y < height - 1:
+        d_y = offset(result[y - 1, x], result[y, x], result[y + 1, x])
+    return x + float(d_x), y + float(d_y)
+
+
+def predict_player(lead=0):
+    """
+    Estimates where the player will be LEAD seconds from now using the filtered
+    player state. Returns the last measured position instead if the player's icon
+    was not found in the latest minimap, or if the state is more than
+    PLAYER_STATE_MAX_AGE seconds old.
+    :param lead:    The number of seconds to look ahead, which is the furthest the
+                    state is ever extrapolated.
+    :return:        The player's predicted position in relative coordinates.
+    """
+
+    state = config.player_state
+    now = time.time()
+    if state is None or config.player_confidence == 0 \
+            or now - state.timestamp > PLAYER_STATE_MAX_AGE:
+        return config.player_pos
+    return state.predict(now + lead, limit=lead)
+
+
+def convert_to_relative(point, frame, ratio=None):
     """
     Converts POINT into relative coordinates in the range [0, 1] based on FRAME.
     Normalizes the units of the vertical axis to equal those of the horizontal
     axis by using config.mm_ratio.
     :param point:   The point in absolute coordinates.
     :param frame:   The image to use as a reference.
+    :param ratio:   The minimap's aspect ratio, defaults to that of config.capture.
     :return:        The given point in relative coordinates.
     """
 
+    if ratio is None:
+        ratio = config.capture.minimap_ratio
     x = point[0] / frame.shape[1]
-    y = point[1] / config.capture.minimap_ratio / frame.shape[0]
+    y = point[1] / ratio / frame.shape[0]
     return x, y
 
 
@@ -141,27 +319,6 @@ def convert_to_absolute(point, frame):
     return x, y
 
 
-def filter_color(img, ranges):
-    """
-    Returns a filtered copy of IMG that only contains pixels within the given RANGES.
-    on the HSV scale.
-    :param img:     The image to filter.
-    :param ranges:  A list of tuples, each of which is a pair upper and lower HSV bounds.
-    :return:        A filtered copy of IMG.
-    """
-
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    mask = cv2.inRange(hsv, ranges[0][0], ranges[0][1])
-    for i in range(1, len(ranges)):
-        mask = cv2.bitwise_or(mask, cv2.inRange(hsv, ranges[i][0], ranges[i][1]))
-
-    # Mask the image
-    color_mask = mask > 0
-    result = np.zeros_like(img, np.uint8)
-    result[color_mask] = img[color_mask]
-    return result
-
-
 def draw_location(minimap, pos, color):
     """
     Draws a visual representation of POINT onto MINIMAP. The radius of the circle represents
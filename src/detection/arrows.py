@@ -0,0 +1,103 @@
+"""
+Classifies a rune's arrows by their shape, which takes a few milliseconds. Every arrow
+is mirror symmetric about the axis it points along, and narrows to a tip at the end it
+points towards. Frames that do not clearly show four such arrows get a low confidence,
+so that they can be classified by the detection model instead.
+
+The thresholds below have only been checked against synthetic frames, so this
+classifier is only used if 'Shape classifier' is enabled in the detection settings.
+"""
+
+import cv2
+import numpy as np
+from src.common import colors
+
+
+# The smallest area in pixels of a shape that is considered to be an arrow
+MIN_AREA = 150
+
+# The confidence below which a classification should not be trusted
+MIN_CONFIDENCE = 0.2
+
+# How closely an arrow must match its own mirror image about the axis it points along
+MIN_SYMMETRY = 0.8
+
+# The fraction of an arrow's length at each end that is compared to find its tip
+END_FRACTION = 0.15
+
+KERNEL = np.ones((3, 3), np.uint8)
+
+
+def classify(image):
+    """
+    Finds four arrows in IMAGE and the direction that each one points in.
+    :param image:   The BGR(A) region of the frame that contains the rune's arrows.
+    :return:        The directions of the arrows from left to right, and the confidence
+                    of the least certain one. The directions are empty and the
+                    confidence is zero if IMAGE does not contain exactly four arrows.
+    """
+
+    mask = colors.TABLE.mask(image, 'arrow')
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, KERNEL)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = [c for c in contours if cv2.contourArea(c) >= MIN_AREA]
+    if len(contours) != 4:
+        return [], 0
+
+    # The arrows are the same size and lie in a row
+    rects = [cv2.boundingRect(c) for c in contours]
+    areas = [w * h for _, _, w, h in rects]
+    centers_y = [y + h / 2 for _, y, _, h in rects]
+    size = np.median([max(w, h) for _, _, w, h in rects])
+    if min(areas) < 0.5 * max(areas) or max(centers_y) - min(centers_y) > size / 2:
+        return [], 0
+
+    directions = []
+    confidence = 1.0
+    for contour, rect in sorted(zip(contours, rects), key=lambda pair: pair[1][0]):
+        direction, certainty = classify_arrow(contour, rect)
+        directions.append(direction)
+        confidence = min(confidence, certainty)
+    return directions, confidence
+
+
+def classify_arrow(contour, rect):
+    """
+    Determines the direction of a single arrow from its outline.
+    :param contour: The outer contour of the arrow.
+    :param rect:    The (x, y, width, height) bounding box of CONTOUR.
+    :return:        The direction of the arrow, and how certain that direction is
+                    between 0 and 1. A perfectly drawn arrow has a certainty of about 0.4.
+    """
+
+    x, y, width, height = rect
+    shape = np.zeros((height, width), np.uint8)
+    cv2.drawContours(shape, [contour], -1, 1, cv2.FILLED, offset=(-x, -y))
+
+    # An arrow is mirror symmetric about the axis that it points along
+    vertical = _symmetry(shape, shape[:, ::-1])
+    horizontal = _symmetry(shape, shape[::-1, :])
+    if max(vertical, horizontal) < MIN_SYMMETRY:
+        return None, 0
+    if vertical >= horizontal:
+        profile = shape.sum(axis=1)
+        directions = ('up', 'down')
+    else:
+        profile = shape.sum(axis=0)
+        directions = ('left', 'right')
+
+    # The end that the arrow points towards is narrower than its tail
+    n = max(1, round(len(profile) * END_FRACTION))
+    start = profile[:n].mean()
+    end = profile[-n:].mean()
+    narrow, wide = min(start, end), max(start, end)
+    direction = directions[0] if start < end else directions[1]
+    taper = 1 - narrow / wide if wide > 0 else 0
+    return direction, min(abs(vertical - horizontal), taper)
+
+
+def _symmetry(a, b):
+    """Returns the intersection over union of the binary images A and B."""
+
+    union = np.count_nonzero(a | b)
+    return np.count_nonzero(a & b) / union if union else 0
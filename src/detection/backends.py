@@ -0,0 +1,168 @@
+"""
+Interchangeable runtimes for the rune arrow detection model. The TensorFlow backend
+runs the original saved model. The ONNX Runtime and OpenCV DNN backends run the same
+model on the CPU after it has been exported to ONNX, which can be done using tf2onnx:
+
+    python -m tf2onnx.convert --saved-model assets/models/rune_model_rnn_filtered_cannied/saved_model
+                              --output assets/models/rune_model_rnn_filtered_cannied/model.onnx
+                              --opset 13
+
+The backend is chosen in the 'Rune Detection' settings and takes effect on restart.
+The OpenCV backend is experimental: OpenCV's DNN module often cannot load exported
+object detection models, whose graphs contain dynamic loops and non-max suppression.
+Check any backend with src.detection.equivalence before relying on it.
+"""
+
+import os
+import cv2
+from src.common.interfaces import Configurable
+
+
+MODEL_DIR = os.path.join('assets', 'models', 'rune_model_rnn_filtered_cannied')
+SAVED_MODEL_PATH = os.path.join(MODEL_DIR, 'saved_model')
+ONNX_PATH = os.path.join(MODEL_DIR, 'model.onnx')
+
+# The outputs that every backend must return
+OUTPUT_KEYS = ('detection_boxes', 'detection_scores', 'detection_classes', 'num_detections')
+
+
+class BackendError(Exception):
+    """Raised when a backend cannot be loaded or fails to run an inference."""
+
+
+class Backend:
+    """Runs the detection model on batches of images. Subclasses must override RUN."""
+
+    supports_batching = True        # Whether RUN accepts batches of more than one image
+
+    def run(self, batch):
+        """
+        Runs the model once.
+        :param batch:   A uint8 array of N images with the shape (N, height, width, 3).
+        :return:        A dictionary mapping each of OUTPUT_KEYS to a Numpy array
+                        whose first axis has length N.
+        """
+
+        raise NotImplementedError
+
+
+class TensorFlowBackend(Backend):
+    """Runs the saved model using TensorFlow."""
+
+    def __init__(self, path=SAVED_MODEL_PATH):
+        try:
+            import tensorflow as tf
+            model = tf.saved_model.load(path)
+        except (ImportError, OSError) as e:
+            raise BackendError(f'Unable to load TensorFlow model: {e}')
+        self.tf = tf
+        self.model = model
+        self.model_fn = model.signatures['serving_default']
+
+    def run(self, batch):
+        try:
+            outputs = self.model_fn(self.tf.convert_to_tensor(batch))
+        except (self.tf.errors.InvalidArgumentError, ValueError, TypeError) as e:
+            raise BackendError(str(e))
+        return {key: outputs[key].numpy() for key in OUTPUT_KEYS}
+
+
+class OnnxBackend(Backend):
+    """Runs the exported ONNX model on the CPU using ONNX Runtime."""
+
+    def __init__(self, path=ONNX_PATH):
+        try:
+            import onnxruntime
+            self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        except Exception as e:      # ONNX Runtime raises its own exception types
+            raise BackendError(f'Unable to load ONNX model: {e}')
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.supports_batching = model_input.shape[0] != 1
+        self.outputs = _match_outputs([output.name for output in self.session.get_outputs()])
+
+    def run(self, batch):
+        try:
+            values = self.session.run(list(self.outputs.values()), {self.input_name: batch})
+        except Exception as e:
+            raise BackendError(str(e))
+        return dict(zip(self.outputs, values))
+
+
+class OpenCVBackend(Backend):
+    """Runs the exported ONNX model on the CPU using OpenCV's DNN module. Experimental."""
+
+    def __init__(self, path=ONNX_PATH):
+        try:
+            self.net = cv2.dnn.readNetFromONNX(path)
+        except cv2.error as e:
+            raise BackendError(f'Unable to load ONNX model with OpenCV: {e}')
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.outputs = _match_outputs(self.net.getUnconnectedOutLayersNames())
+
+    def run(self, batch):
+        try:
+            self.net.setInput(batch)
+            values = self.net.forward(list(self.outputs.values()))
+        except cv2.error as e:
+            raise BackendError(str(e))
+        return dict(zip(self.outputs, values))
+
+
+# Backends that have not been shown to load and agree with the saved model
+EXPERIMENTAL = {'opencv'}
+
+BACKENDS = {
+    'tensorflow': TensorFlowBackend,
+    'onnx': OnnxBackend,
+    'opencv': OpenCVBackend
+}
+
+
+class DetectionSettings(Configurable):
+    DEFAULT_CONFIG = {
+        'Backend': 'tensorflow',
+        'Shape classifier': False       # Experimental, only checked against synthetic frames
+    }
+
+    def get(self, key):
+        return self.config[key]
+
+    def set(self, key, value):
+        assert key in self.config
+        self.config[key] = value
+
+
+def create(name=None):
+    """
+    Loads a detection backend.
+    :param name:    The name of a backend in BACKENDS, defaults to the one in the settings.
+    :return:        The loaded Backend.
+    """
+
+    if name is None:
+        name = DetectionSettings('detection').get('Backend')
+    if name not in BACKENDS:
+        raise BackendError(f"Unknown detection backend '{name}'")
+    if name in EXPERIMENTAL:
+        print(f"\n[!] The '{name}' detection backend is experimental, "
+              'check it using src.detection.equivalence')
+    return BACKENDS[name]()
+
+
+def _match_outputs(names):
+    """
+    Finds the name of the exported model's output for each of OUTPUT_KEYS, which
+    exporters may decorate with a suffix such as ':0'.
+    :param names:   The names of the model's outputs.
+    :return:        A dictionary mapping each of OUTPUT_KEYS to an output name.
+    """
+
+    outputs = {}
+    for key in OUTPUT_KEYS:
+        matches = [n for n in names if n == key or n.split(':')[0].split('/')[-1] == key]
+        if not matches:
+            raise BackendError(f"Exported model has no '{key}' output")
+        outputs[key] = matches[0]
+    return outputs
@@ -1,24 +1,119 @@
-"""A module for classifying directional arrows using TensorFlow."""
+"""A module for classifying directional arrows using the rune detection model."""
 
 import cv2
-import tensorflow as tf
+import time
 import numpy as np
-from src.common import utils
+from src.common import colors, utils
+from src.detection import arrows, backends
+
+
+# The size of the black canvas that the rune box is centered on before classification
+PAD_HEIGHT = 384
+PAD_WIDTH = 455
 
 
 #########################
-#       Functions       #
+#       Detector        #
 #########################
-def load_model():
+class Detector:
     """
-    Loads the saved model's weights into an Tensorflow model.
-    :return:    The Tensorflow model object.
+    Runs inferences using one of the runtimes in backends.BACKENDS. The model is warmed
+    up on inputs of the padded shapes when it is created so that the first rune solve
+    does not pay for the runtime's one-time setup.
     """
 
-    model_dir = f'assets/models/rune_model_rnn_filtered_cannied/saved_model'
-    return tf.saved_model.load(model_dir)
+    def __init__(self, backend=None, warm_up_runs=3):
+        """
+        Loads the model and warms it up.
+        :param backend:         The Backend to run inferences with, defaults to the one
+                                chosen in the detection settings.
+        :param warm_up_runs:    The number of inferences to run on each padded shape.
+        """
+
+        self.backend = backends.create() if backend is None else backend
+        self.batching = self.backend.supports_batching      # Cleared if batches are rejected
+        self.cold_latency = None        # Seconds taken by the very first inference
+        self.warm_latency = None        # Average seconds taken by later inferences
+        if warm_up_runs > 0:
+            self.warm_up(warm_up_runs)
+
+    def warm_up(self, runs):
+        """
+        Runs inferences on blank images of the shapes used by MERGE_DETECTION, an
+        upright and a rotated padded image, and records how long the first and the
+        remaining inferences took.
+        :param runs:    The number of inferences to run on each shape.
+        :return:        None
+        """
+
+        blanks = [np.zeros((PAD_HEIGHT, PAD_WIDTH, 3), np.uint8),
+                  np.zeros((PAD_WIDTH, PAD_HEIGHT, 3), np.uint8)]
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            self.infer_batch(blanks)
+            timings.append(time.perf_counter() - start)
+        if self.cold_latency is None:
+            self.cold_latency = timings[0]
+        warm = timings[1:]
+        if warm:
+            self.warm_latency = sum(warm) / len(warm)
+            print(f'\n[~] Detection latency: {self.cold_latency * 1000:.0f} ms cold, '
+                  f'{self.warm_latency * 1000:.0f} ms warm')
+
+    def infer(self, image):
+        """
+        Performs an inference once.
+        :param image:   The input image.
+        :return:        The model's predictions including bounding boxes and classes.
+        """
+
+        return _unpack(self.backend.run(np.asarray(image)[np.newaxis]), 0)
+
+    def infer_batch(self, images):
+        """
+        Performs an inference on each of IMAGES. If the model supports batching, images
+        of the same shape are classified in a single call. Images are never padded to a
+        common shape, since that would change what the model sees.
+        :param images:  The input images, which may have different shapes.
+        :return:        A list of the model's predictions for each image.
+        """
+
+        results = [None] * len(images)
+        groups = {}
+        for i, image in enumerate(images):
+            groups.setdefault(image.shape, []).append(i)
+        for indices in groups.values():
+            if self.batching and len(indices) > 1:
+                try:
+                    output_dict = self.backend.run(np.stack([images[i] for i in indices]))
+                except backends.BackendError:
+                    print('\n[~] Detection model does not support batching, '
+                          'running inferences one at a time')
+                    self.batching = False
+                else:
+                    for j, i in enumerate(indices):
+                        results[i] = _unpack(output_dict, j)
+                    continue
+            for i in indices:
+                results[i] = self.infer(images[i])
+        return results
+
+
+def _unpack(output_dict, i):
+    """Returns the predictions for the Ith image of a batch as Numpy arrays."""
+
+    num_detections = int(output_dict['num_detections'][i])
+    result = {key: value[i, :num_detections]
+              for key, value in output_dict.items() if key != 'num_detections'}
+    result['num_detections'] = num_detections
+    result['detection_classes'] = result['detection_classes'].astype(np.int64)
+    return result
 
 
+#########################
+#       Functions       #
+#########################
 def canny(image):
     """
     Performs Canny edge detection on IMAGE.
@@ -39,49 +134,46 @@ def filter_color(image):
     :return:        The color-filtered image.
     """
 
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    mask = cv2.inRange(hsv, (1, 100, 100), (75, 255, 255))
-
-    # Mask the image
-    color_mask = mask > 0
-    arrows = np.zeros_like(image, np.uint8)
-    arrows[color_mask] = image[color_mask]
-    return arrows
+    return colors.filter_color(image, 'arrow')
 
 
 def run_inference_for_single_image(model, image):
     """
     Performs an inference once.
-    :param model:   The model object to use.
+    :param model:   The Detector to use.
     :param image:   The input image.
     :return:        The model's predictions including bounding boxes and classes.
     """
 
-    image = np.asarray(image)
-
-    input_tensor = tf.convert_to_tensor(image)
-    input_tensor = input_tensor[tf.newaxis,...]
-
-    model_fn = model.signatures['serving_default']
-    output_dict = model_fn(input_tensor)
-
-    num_detections = int(output_dict.pop('num_detections'))
-    output_dict = {key: value[0,:num_detections].numpy() 
-                   for key, value in output_dict.items()}
-    output_dict['num_detections'] = num_detections
-    output_dict['detection_classes'] = output_dict['detection_classes'].astype(np.int64)
-    return output_dict
+    return model.infer(image)
 
 
 def sort_by_confidence(model, image):
     """
     Runs a single inference on the image and returns the best four classifications.
-    :param model:   The model object to use.
+    :param model:   The Detector to use.
     :param image:   The input image.
     :return:        The model's top four predictions.
     """
 
     output_dict = run_inference_for_single_image(model, image)
+    return _best_four(output_dict)
+
+
+def sort_batch_by_confidence(model, images):
+    """
+    Classifies every image in IMAGES, batching images of the same shape if possible.
+    :param model:   The Detector to use.
+    :param images:  The input images.
+    :return:        The model's top four predictions for each image.
+    """
+
+    return [_best_four(output_dict) for output_dict in model.infer_batch(images)]
+
+
+def _best_four(output_dict):
+    """Returns the four most confident predictions in OUTPUT_DICT that are above 50%."""
+
     zipped = list(zip(output_dict['detection_scores'],
                       output_dict['detection_boxes'],
                       output_dict['detection_classes']))
@@ -94,85 +186,144 @@ def sort_by_confidence(model, image):
 def get_boxes(model, image):
     """
     Returns the bounding boxes of the top four classified arrows.
-    :param model:   The model object to predict with.
+    :param model:   The Detector to predict with.
     :param image:   The input image.
     :return:        Up to four bounding boxes.
     """
 
     output_dict = run_inference_for_single_image(model, image)
-    zipped = list(zip(output_dict['detection_scores'],
-                      output_dict['detection_boxes'],
-                      output_dict['detection_classes']))
-    pruned = [t for t in zipped if t[0] > 0.5]
-    pruned.sort(key=lambda x: x[0], reverse=True)
-    pruned = pruned[:4]
-    boxes = [t[1:] for t in pruned]
+    boxes = [t[1:] for t in _best_four(output_dict)]
     return boxes
 
 
 @utils.run_if_enabled
-def merge_detection(model, image):
+def merge_detection(model, image, fast=False):
     """
-    Run two inferences: one on the upright image, and one on the image rotated 90 degrees.
-    Only considers vertical arrows and merges the results of the two inferences together.
+    If FAST is set, classifies the arrows by their shape first, and only uses the model
+    if that is not confident enough. The model runs two inferences: one on the upright image,
+    and one on the image rotated 90 degrees. Only considers vertical arrows and merges
+    the results of the two inferences together.
     (Vertical arrows in the rotated image are actually horizontal arrows).
-    :param model:   The model object to use.
+    :param model:   The Detector to use, or None to only classify arrows by their shape.
     :param image:   The input image.
+    :param fast:    Whether to try classifying the arrows by their shape first.
     :return:        A list of four arrow directions.
     """
 
-    label_map = {1: 'up', 2: 'down', 3: 'left', 4: 'right'}
-    converter = {'up': 'right', 'down': 'left'}         # For the 'rotated inferences'
-    classes = []
-    
+    return _merge_detections(model, [image], fast)[0]
+
+
+@utils.run_if_enabled
+def merge_detection_batch(model, images, fast=False):
+    """
+    Solves the rune in each of IMAGES like MERGE_DETECTION does. The frames are the same
+    size, so each stage of the model runs once on a batch of every frame's cropped,
+    upright or rotated image.
+    :param model:   The Detector to use, or None to only classify arrows by their shape.
+    :param images:  The input images, usually consecutive frames of the same rune.
+    :param fast:    Whether to try classifying the arrows by their shape first.
+    :return:        A list of arrow directions for each image.
+    """
+
+    return _merge_detections(model, images, fast)
+
+
+def _merge_detections(model, images, fast):
+    """Returns the arrow directions in each of IMAGES, see MERGE_DETECTION_BATCH."""
+
+    solutions = [[] for _ in images]
+
     # Preprocessing
+    indices = []
+    cannied = []
+    for i, image in enumerate(images):
+        height, width, channels = image.shape
+        cropped = image[120:height//2, width//4:3*width//4]
+        if fast:
+            shapes, confidence = arrows.classify(cropped)
+            if confidence >= arrows.MIN_CONFIDENCE:
+                solutions[i] = shapes
+                continue
+        if model is not None:
+            indices.append(i)
+            cannied.append(canny(filter_color(cropped)))
+    if not indices:
+        return solutions
+
+    # Only run further inferences if arrows have been correctly detected
+    found = []
+    preprocessed = []
+    for i, image, best in zip(indices, cannied, sort_batch_by_confidence(model, cannied)):
+        boxes = [t[1:] for t in best]
+        if len(boxes) == 4:
+            found.append(i)
+            preprocessed.append(_isolate_rune_box(image, boxes))
+    if not found:
+        return solutions
+
+    # Run detection on the preprocessed and rotated images
+    rotated = [cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE) for image in preprocessed]
+    results = sort_batch_by_confidence(model, preprocessed + rotated)
+    for j, i in enumerate(found):
+        solutions[i] = _merge_classes(results[j], results[len(found) + j])
+    return solutions
+
+
+def _isolate_rune_box(image, boxes):
+    """
+    Crops the arrows out of IMAGE and pads them with black borders, effectively
+    eliminating the noise around them.
+    :param image:   The cannied image.
+    :param boxes:   The bounding boxes of the four arrows in IMAGE.
+    :return:        A PAD_HEIGHT x PAD_WIDTH image with the arrows at its center.
+    """
+
     height, width, channels = image.shape
-    cropped = image[120:height//2, width//4:3*width//4]
-    filtered = filter_color(cropped)
-    cannied = canny(filtered)
-
-    # Isolate the rune box
-    height, width, channels = cannied.shape
-    boxes = get_boxes(model, cannied)
-    if len(boxes) == 4:      # Only run further inferences if arrows have been correctly detected
-        y_mins = [b[0][0] for b in boxes]
-        x_mins = [b[0][1] for b in boxes]
-        y_maxes = [b[0][2] for b in boxes]
-        x_maxes = [b[0][3] for b in boxes]
-        left = int(round(min(x_mins) * width))
-        right = int(round(max(x_maxes) * width))
-        top = int(round(min(y_mins) * height))
-        bottom = int(round(max(y_maxes) * height))
-        rune_box = cannied[top:bottom, left:right]
-
-        # Pad the rune box with black borders, effectively eliminating the noise around it
-        height, width, channels = rune_box.shape
-        pad_height, pad_width = 384, 455
-        preprocessed = np.full((pad_height, pad_width, channels), (0, 0, 0), dtype=np.uint8)
-        x_offset = (pad_width - width) // 2
-        y_offset = (pad_height - height) // 2
-
-        if x_offset > 0 and y_offset > 0:
-            preprocessed[y_offset:y_offset+height, x_offset:x_offset+width] = rune_box
-
-        # Run detection on preprocessed image
-        lst = sort_by_confidence(model, preprocessed)
-        lst.sort(key=lambda x: x[1][1])
-        classes = [label_map[item[2]] for item in lst]
-
-        # Run detection on rotated image
-        rotated = cv2.rotate(preprocessed, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        lst = sort_by_confidence(model, rotated)
-        lst.sort(key=lambda x: x[1][2], reverse=True)
-        rotated_classes = [converter[label_map[item[2]]]
-                           for item in lst
-                           if item[2] in [1, 2]]
-            
-        # Merge the two detection results
-        for i in range(len(classes)):
-            if rotated_classes and classes[i] in ['left', 'right']:
-                classes[i] = rotated_classes.pop(0)
+    y_mins = [b[0][0] for b in boxes]
+    x_mins = [b[0][1] for b in boxes]
+    y_maxes = [b[0][2] for b in boxes]
+    x_maxes = [b[0][3] for b in boxes]
+    left = int(round(min(x_mins) * width))
+    right = int(round(max(x_maxes) * width))
+    top = int(round(min(y_mins) * height))
+    bottom = int(round(max(y_maxes) * height))
+    rune_box = image[top:bottom, left:right]
+
+    height, width, channels = rune_box.shape
+    pad_height, pad_width = PAD_HEIGHT, PAD_WIDTH
+    preprocessed = np.full((pad_height, pad_width, channels), (0, 0, 0), dtype=np.uint8)
+    x_offset = (pad_width - width) // 2
+    y_offset = (pad_height - height) // 2
+
+    if x_offset > 0 and y_offset > 0:
+        preprocessed[y_offset:y_offset+height, x_offset:x_offset+width] = rune_box
+    return preprocessed
+
+
+def _merge_classes(lst, rotated_lst):
+    """
+    Merges the predictions for the upright and rotated images into four directions.
+    :param lst:         The top four predictions for the upright image.
+    :param rotated_lst: The top four predictions for the rotated image.
+    :return:            A list of arrow directions from left to right.
+    """
+
+    label_map = {1: 'up', 2: 'down', 3: 'left', 4: 'right'}
+    converter = {'up': 'right', 'down': 'left'}         # For the 'rotated inferences'
+
+    lst.sort(key=lambda x: x[1][1])
+    classes = [label_map[item[2]] for item in lst]
+
+    lst = rotated_lst
+    lst.sort(key=lambda x: x[1][2], reverse=True)
+    rotated_classes = [converter[label_map[item[2]]]
+                       for item in lst
+                       if item[2] in [1, 2]]
 
+    # Merge the two detection results
+    for i in range(len(classes)):
+        if rotated_classes and classes[i] in ['left', 'right']:
+            classes[i] = rotated_classes.pop(0)
     return classes
 
 
@@ -182,7 +333,7 @@ if __name__ == '__main__':
     import mss
     config.enabled = True
     monitor = {'top': 0, 'left': 0, 'width': 1366, 'height': 768}
-    model = load_model()
+    model = Detector()
     while True:
         with mss.mss() as sct:
             frame = np.array(sct.grab(monitor))
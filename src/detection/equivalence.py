@@ -0,0 +1,159 @@
+"""
+Checks that a detection backend makes the same predictions as the original TensorFlow
+model on a fixed set of synthetic rune frames. Run it from the repository root after
+exporting the model to ONNX:
+
+    python -m src.detection.equivalence [--backend onnx] [--seeds 8]
+
+Every preprocessed image that MERGE_DETECTION would classify is run through both
+backends, and their highest scoring predictions must have the same classes, with boxes
+and scores that agree to within the given tolerances, however low those scores are.
+TensorFlow must also make a confident prediction on every image, since otherwise the
+fixtures would not exercise the model. Each backend's batched inferences must also
+agree with classifying the same images one at a time, including when whole rune
+frames are solved in a batch. Exits with status 1 on any mismatch.
+"""
+
+import sys
+import cv2
+import argparse
+import numpy as np
+from src.common import config
+from src.benchmarks import fixtures
+from src.detection import backends, detection
+
+
+def get_images(seeds):
+    """
+    Builds the inputs that MERGE_DETECTION classifies for each fixture rune frame.
+    :param seeds:   The number of rune frames to generate.
+    :return:        A list of (name, image) pairs.
+    """
+
+    images = []
+    for seed in range(seeds):
+        frame = fixtures.rune_frame(seed)
+        height, width = frame.shape[:2]
+        cropped = frame[120:height//2, width//4:3*width//4]
+        cannied = detection.canny(detection.filter_color(cropped))
+        images.append((f'cannied {seed}', cannied))
+
+        # Center the arrows on a padded canvas like MERGE_DETECTION does
+        mask = cannied.any(axis=2)
+        if not mask.any():
+            continue
+        ys, xs = np.nonzero(mask)
+        rune_box = cannied[ys.min():ys.max() + 1, xs.min():xs.max() + 1]
+        h, w = rune_box.shape[:2]
+        padded = np.zeros((detection.PAD_HEIGHT, detection.PAD_WIDTH, 3), np.uint8)
+        top, left = (detection.PAD_HEIGHT - h) // 2, (detection.PAD_WIDTH - w) // 2
+        if top > 0 and left > 0:
+            padded[top:top+h, left:left+w] = rune_box
+        images.append((f'padded {seed}', padded))
+        images.append((f'rotated {seed}', cv2.rotate(padded, cv2.ROTATE_90_COUNTERCLOCKWISE)))
+    return images
+
+
+def compare(expected, actual, top_k, box_tolerance, score_tolerance):
+    """
+    Compares the raw predictions of two backends on the same image, regardless of
+    how confident they are.
+    :param expected:        The reference backend's predictions, as returned by Detector.infer.
+    :param actual:          The other backend's predictions.
+    :param top_k:           The number of highest scoring predictions to compare.
+    :param box_tolerance:   The largest allowed difference of any box coordinate.
+    :param score_tolerance: The largest allowed difference of any score.
+    :return:                A description of the first difference, or None if they match.
+    """
+
+    expected = _top_k(expected, top_k)
+    actual = _top_k(actual, top_k)
+    if len(actual) < len(expected):
+        return f'{len(actual)} predictions instead of {len(expected)}'
+    for i, ((e_score, e_box, e_class), (a_score, a_box, a_class)) in enumerate(zip(expected, actual)):
+        if e_class != a_class:
+            return f'prediction {i} has class {a_class} instead of {e_class}'
+        if abs(e_score - a_score) > score_tolerance:
+            return f'prediction {i} has score {a_score:.4f} instead of {e_score:.4f}'
+        box_error = np.abs(np.asarray(e_box) - np.asarray(a_box)).max()
+        if box_error > box_tolerance:
+            return f'prediction {i} has a box that is off by {box_error:.4f}'
+    return None
+
+
+def _top_k(output_dict, k):
+    """Returns the K highest scoring (score, box, class) predictions in OUTPUT_DICT."""
+
+    order = np.argsort(-output_dict['detection_scores'], kind='stable')[:k]
+    return [(output_dict['detection_scores'][i],
+             output_dict['detection_boxes'][i],
+             output_dict['detection_classes'][i]) for i in order]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares a detection backend against TensorFlow.')
+    parser.add_argument('--backend', default='onnx', choices=sorted(backends.BACKENDS),
+                        help='the backend to check')
+    parser.add_argument('--seeds', type=int, default=8, help='the number of fixture rune frames')
+    parser.add_argument('--top-k', type=int, default=10,
+                        help='the number of highest scoring predictions to compare')
+    parser.add_argument('--box-tolerance', type=float, default=0.01,
+                        help='the largest allowed difference of a normalized box coordinate')
+    parser.add_argument('--score-tolerance', type=float, default=0.02,
+                        help='the largest allowed difference of a score')
+    args = parser.parse_args()
+
+    reference = detection.Detector(backends.create('tensorflow'), warm_up_runs=0)
+    candidate = detection.Detector(backends.create(args.backend), warm_up_runs=0)
+
+    mismatches = 0
+    images = get_images(args.seeds)
+    checks = len(images)
+    for name, image in images:
+        expected = reference.infer(image)
+        error = compare(expected, candidate.infer(image),
+                        args.top_k, args.box_tolerance, args.score_tolerance)
+        if not detection._best_four(expected):
+            error = 'TensorFlow found no confident arrows, so the fixture checks nothing'
+        if error is not None:
+            mismatches += 1
+            print(f'[!] {name}: {error}')
+
+    # Batched inferences must match classifying each image on its own
+    batches = [[image for name, image in images if name.startswith(kind)]
+               for kind in ('padded', 'rotated')]
+    batches += [[padded, rotated] for padded, rotated in zip(*batches)]
+    batches.append([image for name, image in images if name.startswith('cannied')])
+    for detector, backend in ((reference, 'tensorflow'), (candidate, args.backend)):
+        for batch in batches:
+            for i, (image, batched) in enumerate(zip(batch, detector.infer_batch(batch))):
+                checks += 1
+                error = compare(detector.infer(image), batched,
+                                args.top_k, args.box_tolerance, args.score_tolerance)
+                if error is not None:
+                    mismatches += 1
+                    print(f'[!] {backend} batch of {len(batch)}, image {i}: {error}')
+
+    # The final arrow directions must match exactly, whether or not frames are batched
+    config.enabled = True
+    frames = [fixtures.rune_frame(seed) for seed in range(args.seeds)]
+    batched = detection.merge_detection_batch(candidate, frames, fast=False)
+    for seed, frame in enumerate(frames):
+        checks += 2
+        expected = detection.merge_detection(reference, frame, fast=False)
+        actual = detection.merge_detection(candidate, frame, fast=False)
+        if expected != actual:
+            mismatches += 1
+            print(f'[!] rune frame {seed}: {args.backend} solved {actual} instead of {expected}')
+        if batched[seed] != actual:
+            mismatches += 1
+            print(f'[!] rune frame {seed}: {args.backend} solved {batched[seed]} '
+                  f'in a batch instead of {actual}')
+
+    print(f"\n[~] '{args.backend}' passed {checks - mismatches}/{checks} checks")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
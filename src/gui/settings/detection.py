@@ -0,0 +1,47 @@
+import tkinter as tk
+from src.gui.interfaces import LabelFrame, Frame
+from src.detection.backends import BACKENDS, EXPERIMENTAL, DetectionSettings
+
+
+class Detection(LabelFrame):
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, 'Rune Detection', **kwargs)
+
+        self.detection_settings = DetectionSettings('detection')
+        self.backend = tk.StringVar(value=self.detection_settings.get('Backend'))
+        self.shapes = tk.BooleanVar(value=bool(self.detection_settings.get('Shape classifier')))
+
+        backend_row = Frame(self)
+        backend_row.pack(side=tk.TOP, fill='x', expand=True, pady=5, padx=5)
+        label = tk.Label(backend_row, text='Backend:')
+        label.pack(side=tk.LEFT, padx=(0, 15))
+        radio_group = Frame(backend_row)
+        radio_group.pack(side=tk.LEFT)
+        for name in BACKENDS:
+            radio = tk.Radiobutton(
+                radio_group,
+                text=f'{name} (experimental)' if name in EXPERIMENTAL else name,
+                variable=self.backend,
+                value=name,
+                command=self._on_change
+            )
+            radio.pack(side=tk.LEFT, padx=(0, 10))
+
+        shapes_row = Frame(self)
+        shapes_row.pack(side=tk.TOP, fill='x', expand=True, pady=(0, 5), padx=5)
+        check = tk.Checkbutton(
+            shapes_row,
+            variable=self.shapes,
+            text='Classify arrows by shape first (experimental)',
+            command=self._on_change
+        )
+        check.pack()
+
+        note = tk.Label(self, text='Takes effect after restarting Auto Maple.\n'
+                                   'Experimental backends may fail to load the model.')
+        note.pack(side=tk.TOP, pady=(0, 5), padx=5)
+
+    def _on_change(self):
+        self.detection_settings.set('Backend', self.backend.get())
+        self.detection_settings.set('Shape classifier', self.shapes.get())
+        self.detection_settings.save_config()
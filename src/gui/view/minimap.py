@@ -21,14 +21,14 @@ class Minimap(LabelFrame):
     def display_minimap(self):
         """Updates the Main page with the current minimap."""
 
-        minimap = config.capture.minimap
-        if minimap:
-            rune_active = minimap['rune_active']
-            rune_pos = minimap['rune_pos']
-            path = minimap['path']
-            player_pos = minimap['player_pos']
+        snapshot = config.capture.snapshot
+        if snapshot is not None:
+            rune_active = config.bot.rune_active
+            rune_pos = config.bot.rune_pos
+            path = config.path
+            player_pos = snapshot.player_pos
 
-            img = cv2.cvtColor(minimap['minimap'], cv2.COLOR_BGR2RGB)
+            img = cv2.cvtColor(snapshot.minimap, cv2.COLOR_BGR2RGB)
             height, width, _ = img.shape
 
             # Resize minimap to fit the Canvas
@@ -22,8 +22,36 @@ class Status(LabelFrame):
         self.r_entry = tk.Entry(self, textvariable=self.curr_routine, state=tk.DISABLED)
         self.r_entry.grid(row=1, column=2, padx=(0, 5), pady=(0, 5), sticky=tk.EW)
 
+        self.curr_capture = tk.StringVar()
+        self.curr_latency = tk.StringVar()
+
+        self.c_label = tk.Label(self, text='Capture:')
+        self.c_label.grid(row=2, column=1, padx=5, pady=(0, 5), sticky=tk.E)
+        self.c_entry = tk.Entry(self, textvariable=self.curr_capture, state=tk.DISABLED)
+        self.c_entry.grid(row=2, column=2, padx=(0, 5), pady=(0, 5), sticky=tk.EW)
+
+        self.l_label = tk.Label(self, text='Latency (p50/p95/p99):')
+        self.l_label.grid(row=3, column=1, padx=5, pady=(0, 5), sticky=tk.E)
+        self.l_entry = tk.Entry(self, textvariable=self.curr_latency, state=tk.DISABLED)
+        self.l_entry.grid(row=3, column=2, padx=(0, 5), pady=(0, 5), sticky=tk.EW)
+
     def set_cb(self, string):
         self.curr_cb.set(string)
 
     def set_routine(self, string):
         self.curr_routine.set(string)
+
+    def set_capture_stats(self, summary, confidence, fps, target_fps):
+        """
+        Displays the dropped frames and stage latencies in SUMMARY, as returned by
+        PipelineStats, along with the CONFIDENCE of the player's position and Capture's
+        effective FPS compared to the TARGET_FPS set by its RateGovernor.
+        """
+
+        self.curr_capture.set(f"{fps:.1f}/{target_fps:.0f} FPS, {summary['dropped']} dropped, "
+                              f"{confidence:.0%} player match")
+        stages = []
+        for stage, p in summary['stages'].items():
+            if p is not None:
+                stages.append(f"{stage} {p['p50']:.1f}/{p['p95']:.1f}/{p['p99']:.1f}")
+        self.curr_latency.set(' | '.join(stages) + ' ms' if stages else '')
@@ -3,23 +3,30 @@
 import threading
 import time
 import git
-import cv2
 import inspect
 import importlib
+import numpy as np
 import traceback
 from os.path import splitext, basename
-from src.common import config, utils
-from src.detection import detection
+from concurrent.futures import Future
+from src.common import config, templates, utils
 from src.routine import components
 from src.routine.routine import Routine
 from src.command_book.command_book import CommandBook
 from src.routine.components import Point
 from src.common.vkeys import press, click
 from src.common.interfaces import Configurable
+from src.detection.backends import DetectionSettings
 
 
-# The rune's buff icon
-RUNE_BUFF_TEMPLATE = cv2.imread('assets/rune_buff_template.jpg', 0)
+# Seconds to spend trying to solve a rune after interacting with it
+RUNE_SOLVE_TIME = 8
+
+# The minimum seconds between the frames of two matching solutions before one is entered
+RUNE_CONFIRM_GAP = 0.3
+
+# The number of frames, RUNE_CONFIRM_GAP seconds apart, that are solved in one batch
+RUNE_BATCH_FRAMES = 2
 
 
 class Bot(Configurable):
@@ -41,6 +48,7 @@ class Bot(Configurable):
         self.rune_closest_pos = (0, 0)      # Location of the Point closest to rune
         self.submodules = []
         self.command_book = None            # CommandBook instance
+        self.model = Future()               # Resolves to the detection model once loaded
         # self.module_name = None
         # self.buff = components.Buff()
 
@@ -62,18 +70,34 @@ class Bot(Configurable):
         """
 
         self.update_submodules()
+        model_thread = threading.Thread(target=self._load_model)
+        model_thread.daemon = True
+        model_thread.start()
         print('\n[~] Started main bot loop')
         self.thread.start()
 
-    def _main(self):
+    def _load_model(self):
         """
-        The main body of Bot that executes the user's routine.
+        Loads the detection model in the background, since importing its runtime and
+        reading the model takes several seconds. Resolves SELF.MODEL when done.
         :return:    None
         """
 
         print('\n[~] Initializing detection algorithm:\n')
-        model = detection.load_model()
-        print('\n[~] Initialized detection algorithm')
+        try:
+            from src.detection import detection
+            self.model.set_result(detection.Detector())
+        except Exception as e:
+            print(f'\n[!] Unable to initialize detection algorithm: {e}')
+            self.model.set_exception(e)
+        else:
+            print('\n[~] Initialized detection algorithm')
+
+    def _main(self):
+        """
+        The main body of Bot that executes the user's routine.
+        :return:    None
+        """
 
         self.ready = True
         config.listener.enabled = True
@@ -98,21 +122,38 @@ class Bot(Configurable):
                 element = config.routine[config.routine.index]
                 if self.rune_active and isinstance(element, Point) \
                         and element.location == self.rune_closest_pos:
-                    self._solve_rune(model)
+                    self._solve_rune()
                 element.execute()
                 config.routine.step()
             else:
                 time.sleep(0.01)
 
     @utils.run_if_enabled
-    def _solve_rune(self, model):
+    def _solve_rune(self):
         """
-        Moves to the position of the rune and solves the arrow-key puzzle.
-        :param model:   The TensorFlow model to classify with.
-        :param sct:     The mss instance object with which to take screenshots.
+        Moves to the position of the rune and solves the arrow-key puzzle. Waits for
+        the detection model if it is still loading. If the shape classifier is enabled,
+        arrows are classified by their shape first, or only by their shape if the model
+        could not be loaded. A solution is entered once the same one has been found in
+        two frames that are at least RUNE_CONFIRM_GAP seconds apart. Frames are taken
+        that far apart and solved RUNE_BATCH_FRAMES at a time, so that the model runs
+        on batches and a single batch can confirm a solution.
         :return:        None
         """
 
+        shapes = bool(DetectionSettings('detection').get('Shape classifier'))
+        if not self.model.done():
+            print('\n[~] Waiting for detection algorithm to finish initializing')
+        try:
+            model = self.model.result()
+        except Exception:
+            if not shapes:
+                print('\n[!] Cannot solve rune without the detection algorithm')
+                return
+            print('\n[!] Detection model is unavailable, only classifying arrows by their shape')
+            model = None
+        from src.detection import detection
+
         move = self.command_book['move']
         move(*self.rune_pos).execute()
         adjust = self.command_book['adjust']
@@ -121,34 +162,56 @@ class Bot(Configurable):
         press(self.config['Interact'], 1, down_time=0.2)        # Inherited from Configurable
 
         print('\nSolving rune:')
-        inferences = []
-        for _ in range(15):
-            frame = config.capture.frame
-            solution = detection.merge_detection(model, frame)
-            if solution:
-                print(', '.join(solution))
-                if solution in inferences:
-                    print('Solution found, entering result')
-                    for arrow in solution:
-                        press(arrow, 1, down_time=0.1)
-                    time.sleep(1)
-                    for _ in range(3):
-                        time.sleep(0.3)
-                        frame = config.capture.frame
-                        rune_buff = utils.multi_match(frame[:frame.shape[0] // 8, :],
-                                                      RUNE_BUFF_TEMPLATE,
-                                                      threshold=0.9)
-                        if rune_buff:
-                            rune_buff_pos = min(rune_buff, key=lambda p: p[0])
-                            target = (
-                                round(rune_buff_pos[0] + config.capture.window['left']),
-                                round(rune_buff_pos[1] + config.capture.window['top'])
-                            )
-                            click(target, button='right')
-                    self.rune_active = False
+        inferences = {}             # The time at which each complete solution was first seen
+        seq = None
+        solution = None
+        deadline = time.time() + RUNE_SOLVE_TIME
+        while solution is None and time.time() < deadline:
+            frames = []
+            timestamps = []
+            for i in range(RUNE_BATCH_FRAMES):
+                if i > 0:
+                    time.sleep(RUNE_CONFIRM_GAP)
+                config.capture.request_frame()
+                snapshot = config.capture.wait_for_next(seq, timeout=1, full=True)
+                seq = snapshot.frame_seq
+                frames.append(snapshot.frame.copy())        # Its buffer is reused later
+                timestamps.append(snapshot.timestamp)
+            solutions = detection.merge_detection_batch(model, frames, fast=shapes)
+            if solutions is None:       # The bot was disabled
+                return
+            for candidate, timestamp in zip(solutions, timestamps):
+                if not candidate:
+                    continue
+                first_seen = inferences.get(tuple(candidate))
+                if first_seen is None:
+                    print(', '.join(candidate))
+                    if len(candidate) == 4:
+                        inferences[tuple(candidate)] = timestamp
+                elif timestamp - first_seen >= RUNE_CONFIRM_GAP:
+                    solution = candidate
                     break
-                elif len(solution) == 4:
-                    inferences.append(solution)
+
+        if solution is not None:
+            print('Solution found, entering result')
+            for arrow in solution:
+                press(arrow, 1, down_time=0.1)
+            time.sleep(1)
+            for _ in range(3):
+                time.sleep(0.3)
+                config.capture.request_frame()
+                gray = config.capture.wait_for_next(timeout=1, full=True).gray()
+                rune_buff, _ = utils.match_peaks(gray[:gray.shape[0] // 8, :],
+                                                 templates.get('rune_buff'),
+                                                 threshold=0.9)
+                if len(rune_buff) > 0:
+                    rune_buff_pos = rune_buff[np.argmin(rune_buff[:, 0])].tolist()
+                    target = (
+                        round(rune_buff_pos[0] + config.capture.window['left']),
+                        round(rune_buff_pos[1] + config.capture.window['top'])
+                    )
+                    click(target, button='right')
+            self.rune_active = False
 
     def load_commands(self, file):
         try:
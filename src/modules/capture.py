@@ -3,14 +3,14 @@
 import time
 import cv2
 import threading
-import ctypes
-import mss
-import mss.windows
-import numpy as np
-from src.common import config, utils
-from ctypes import wintypes
-user32 = ctypes.windll.user32
-user32.SetProcessDPIAware()
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from src.common import config, settings, templates, utils
+from src.common.profiling import PipelineStats
+from src.common.frames import Snapshot, FrameRing, DerivedImages
+from src.common.scanner import MinimapScanner
+from src.common.sources import MssSource, SourceError, find_windows
+from src.common.tracking import PlayerTracker, PlayerFilter
 
 
 # The distance between the top of the minimap and the top of the screen
@@ -23,16 +23,92 @@ MINIMAP_BOTTOM_BORDER = 9
 WINDOWED_OFFSET_TOP = 36
 WINDOWED_OFFSET_LEFT = 10
 
-# The top-left and bottom-right corners of the minimap
-MM_TL_TEMPLATE = cv2.imread('assets/minimap_tl_template.png', 0)
-MM_BR_TEMPLATE = cv2.imread('assets/minimap_br_template.png', 0)
+# The minimum similarity for previously found minimap corners to be reused
+CALIBRATION_THRESHOLD = 0.9
 
-MMT_HEIGHT = max(MM_TL_TEMPLATE.shape[0], MM_BR_TEMPLATE.shape[0])
-MMT_WIDTH = max(MM_TL_TEMPLATE.shape[1], MM_BR_TEMPLATE.shape[1])
 
-# The player's symbol on the minimap
-PLAYER_TEMPLATE = cv2.imread('assets/player_template.png', 0)
-PT_HEIGHT, PT_WIDTH = PLAYER_TEMPLATE.shape
+class RateGovernor:
+    """
+    Paces Capture's main loop according to how much its Snapshots are needed.
+    Capture runs at MAX_FPS while consumers are waiting on new Snapshots, at
+    IDLE_FPS while the bot is enabled but nothing is waiting, and at MIN_FPS
+    while the bot is disabled. Rates that are None follow the settings module, so
+    routines can change them.
+    """
+
+    def __init__(self, min_fps=None, idle_fps=None, max_fps=None, demand_timeout=0.5, wake=None):
+        """
+        Creates a new RateGovernor.
+        :param min_fps:         The capture rate while the bot is disabled, or None to
+                                use settings.min_fps.
+        :param idle_fps:        The capture rate while the bot is enabled but idle, or None
+                                to use settings.idle_fps.
+        :param max_fps:         The capture rate while consumers are waiting on Capture, or
+                                None to use settings.max_fps.
+        :param demand_timeout:  Seconds after the last demand before slowing down.
+        :param wake:            The Event that ends a rest early, defaults to a new Event.
+        """
+
+        self.min_fps = min_fps
+        self.idle_fps = idle_fps
+        self.max_fps = max_fps
+        self.demand_timeout = demand_timeout
+
+        self.fps = 0                    # Exponential moving average of the effective rate
+        self.last_demand = 0
+        self.last_tick = None
+        self.wake = threading.Event() if wake is None else wake
+
+    def demand(self):
+        """Signals that a consumer needs a new Snapshot as soon as possible."""
+
+        now = time.time()
+        if now - self.last_demand >= self.demand_timeout:
+            self.wake.set()         # Stop resting at the slower capture rate
+        self.last_demand = now
+
+    def wake_up(self):
+        """Ends the current rest early without changing the capture rate."""
+
+        self.wake.set()
+
+    def target_fps(self, now):
+        """Returns the capture rate that Capture should currently run at."""
+
+        if now - self.last_demand < self.demand_timeout:
+            fps = self.max_fps if self.max_fps is not None else settings.max_fps
+        elif config.enabled:
+            fps = self.idle_fps if self.idle_fps is not None else settings.idle_fps
+        else:
+            fps = self.min_fps if self.min_fps is not None else settings.min_fps
+        return max(1, fps)
+
+    def rest(self, start):
+        """
+        Sleeps for the remainder of the iteration that began at START, waking early
+        if a consumer demands a new Snapshot.
+        :param start:   The time at which the current iteration began.
+        :return:        None
+        """
+
+        remaining = self.next_time(start) - time.time()
+        if remaining > 0:
+            self.wake.wait(remaining)
+        self.wake.clear()
+        self.tick()
+
+    def next_time(self, start):
+        """Returns the time at which the iteration after the one that began at START is due."""
+
+        return start + 1 / self.target_fps(start)
+
+    def tick(self):
+        """Updates the effective capture rate at the end of an iteration."""
+
+        now = time.time()
+        if self.last_tick is not None and now > self.last_tick:
+            self.fps += 0.1 * (1 / (now - self.last_tick) - self.fps)
+        self.last_tick = now
 
 
 class Capture:
@@ -42,16 +118,48 @@ class Capture:
     displays the minimap in a pop-up window.
     """
 
-    def __init__(self):
-        """Initializes this Capture object's main thread."""
+    def __init__(self, source=None, primary=True, min_fps=None, idle_fps=None, max_fps=None):
+        """
+        Initializes this Capture object's main thread.
+        :param source:      The FrameSource to read frames from, defaults to the live game window.
+        :param primary:     Whether this Capture should be shared through the config module.
+        :param min_fps:     The capture rate while the bot is disabled.
+        :param idle_fps:    The capture rate while the bot is enabled but idle.
+        :param max_fps:     The capture rate while consumers are waiting on new Snapshots.
+                            Rates default to the ones in the settings module.
+        """
 
-        config.capture = self
+        if primary:
+            config.capture = self
 
         self.frame = None
-        self.minimap = {}
+        self.frame_images = None
+        self.frame_seq = 0
+        self.last_frame = 0
+        self.player_pos = (0, 0)
+        self.player_confidence = 0
+        self.player_state = None
+        self.minimap_state = None
+        self.mm_tl = (0, 0)
+        self.mm_br = (0, 0)
+        self.mm_region = None
+        self.snapshot = None
+        self.condition = threading.Condition()
+        self.frames = FrameRing(6)          # Reused buffers for full frames
+        self.minimaps = FrameRing(16)       # Reused buffers for minimap-only grabs
         self.minimap_ratio = 1
         self.minimap_sample = None
-        self.sct = None
+        self.calibrations = {}              # Minimap corners for each window size and routine
+        self.source = MssSource() if source is None else source
+        self.frame_interval = 0.05          # Seconds between full-frame grabs once calibrated
+        self.frame_requested = False
+        self.stats = PipelineStats()
+        self.scale = 1.0                    # The game's UI scale, found during calibration
+        self.tracker = PlayerTracker(templates.get('player', self.scale),
+                                     threshold=0.8, stats=self.stats)
+        self.scanner = MinimapScanner(self.tracker, scale=self.scale, stats=self.stats)
+        self.player_filter = PlayerFilter()
+        self.governor = RateGovernor(min_fps, idle_fps, max_fps)
         self.window = {
             'left': 0,
             'top': 0,
@@ -73,74 +181,339 @@ class Capture:
     def _main(self):
         """Constantly monitors the player's position and in-game events."""
 
-        mss.windows.CAPTUREBLT = 0
-        while True:
-            # Calibrate screen capture
-            handle = user32.FindWindowW(None, 'MapleStory')
-            rect = wintypes.RECT()
-            user32.GetWindowRect(handle, ctypes.pointer(rect))
-            rect = (rect.left, rect.top, rect.right, rect.bottom)
-            rect = tuple(max(0, x) for x in rect)
-
-            self.window['left'] = rect[0]
-            self.window['top'] = rect[1]
-            self.window['width'] = max(rect[2] - rect[0], MMT_WIDTH)
-            self.window['height'] = max(rect[3] - rect[1], MMT_HEIGHT)
-
-            # Calibrate by finding the top-left and bottom-right corners of the minimap
-            with mss.mss() as self.sct:
-                self.frame = self.screenshot()
-            if self.frame is None:
-                continue
-            tl, _ = utils.single_match(self.frame, MM_TL_TEMPLATE)
-            _, br = utils.single_match(self.frame, MM_BR_TEMPLATE)
-            mm_tl = (
-                tl[0] + MINIMAP_BOTTOM_BORDER,
-                tl[1] + MINIMAP_TOP_BORDER
-            )
-            mm_br = (
-                max(mm_tl[0] + PT_WIDTH, br[0] - MINIMAP_BOTTOM_BORDER),
-                max(mm_tl[1] + PT_HEIGHT, br[1] - MINIMAP_BOTTOM_BORDER)
+        with self.source:
+            while not self.source.finished:
+                start = time.time()
+                self.step(start)
+                if self.source.paced:
+                    self.governor.rest(start)
+                else:
+                    self.governor.tick()        # Replay as fast as frames are processed
+        print('\n[~] Video capture has run out of frames')
+
+    def step(self, now):
+        """
+        Performs a single iteration of this Capture. Calibrates if necessary, otherwise
+        grabs the minimap (or periodically the full frame), locates the player and
+        publishes a new Snapshot.
+        :param now:     The time at which this iteration began.
+        :return:        None
+        """
+
+        if not self.calibrated:
+            self._calibrate()
+            return
+
+        # Take screenshot
+        if self.frame_requested or now - self.last_frame >= self.frame_interval:
+            self.frame_requested = False
+            with self.stats.time('grab'):
+                frame = self.screenshot()
+            if frame is None:
+                self.stats.drop()
+                return
+            self.frame = frame
+            self.frame_images = DerivedImages(frame)
+            self.last_frame = now
+            self.frame_seq = self._next_seq()
+
+            # Crop the frame to only show the minimap
+            with self.stats.time('crop'):
+                minimap = frame[self.mm_tl[1]:self.mm_br[1], self.mm_tl[0]:self.mm_br[0]]
+        else:
+            with self.stats.time('grab minimap'):
+                minimap = self.screenshot(self.mm_region, self.minimaps)
+            if minimap is None:
+                self.stats.drop()
+                return
+
+        # Determine the positions of the player and every other icon
+        self.minimap_state = self.scanner.scan(minimap, now)
+        player = self.minimap_state.player
+        if player is not None:
+            self.player_pos = utils.convert_to_relative(player, minimap, self.minimap_ratio)
+            self.player_state = self.player_filter.update(self.player_pos, now,
+                                                          self.minimap_state.confidence)
+        else:
+            self.player_state = None        # Never extrapolate from a lost icon
+        self.player_confidence = self.minimap_state.confidence
+        if config.capture is self:
+            config.player_pos = self.player_pos
+            config.player_confidence = self.player_confidence
+            config.player_state = self.player_state
+
+        # Notify consumers that are waiting for new information
+        with self.stats.time('publish'):
+            self._publish(Snapshot(self._next_seq(), now, self.frame, self.frame_seq,
+                                   minimap, self.player_pos, self.minimap_state,
+                                   self.frame_images))
+        self.stats.tick()
+
+        if not self.ready:
+            self.ready = True
+
+    def _calibrate(self):
+        """Finds the minimap within a new full frame of the game window."""
+
+        self._locate_window()
+        self.frame = self.screenshot()
+        if self.frame is None:
+            return
+        self.frame_images = DerivedImages(self.frame)
+        tl, br = self._find_minimap()
+        pt_height, pt_width = self.tracker.template.shape
+        top_border = round(MINIMAP_TOP_BORDER * self.scale)
+        bottom_border = round(MINIMAP_BOTTOM_BORDER * self.scale)
+        self.mm_tl = (
+            tl[0] + bottom_border,
+            tl[1] + top_border
+        )
+        self.mm_br = (
+            max(self.mm_tl[0] + pt_width, br[0] - bottom_border),
+            max(self.mm_tl[1] + pt_height, br[1] - bottom_border)
+        )
+        self.minimap_ratio = (self.mm_br[0] - self.mm_tl[0]) / (self.mm_br[1] - self.mm_tl[1])
+        self.minimap_sample = self.frame[self.mm_tl[1]:self.mm_br[1],
+                                         self.mm_tl[0]:self.mm_br[0]].copy()
+
+        # Only grab the minimap between full frames
+        self.mm_region = {
+            'left': self.window['left'] + self.mm_tl[0],
+            'top': self.window['top'] + self.mm_tl[1],
+            'width': self.mm_br[0] - self.mm_tl[0],
+            'height': self.mm_br[1] - self.mm_tl[1]
+        }
+        self.last_frame = time.time()
+        self.tracker.reset()
+        self.scanner.reset()
+        self.player_filter.reset()
+        self.player_state = None
+        self.calibrated = True
+
+    def _find_minimap(self):
+        """
+        Finds the top-left and bottom-right corners of the minimap in the current frame,
+        as well as the game's UI scale. Reuses the corners found for the same window size
+        and routine if they still match. Only searches other scales if the corner
+        templates do not match at the current scale, and only adopts another scale if
+        the corners match it well, so that a frame without a minimap leaves every
+        template unchanged. Corners are only remembered if they match.
+        :return:    The top-left corner of the 'minimap_tl' template and the
+                    bottom-right corner of the 'minimap_br' template.
+        """
+
+        routine = config.routine.path if config.routine is not None else ''
+        key = (self.window['width'], self.window['height'], routine)
+        if key in self.calibrations:
+            tl, br, scale = self.calibrations[key]
+            if self._corners_match(tl, br, scale):
+                self._set_scale(scale)
+                return tl, br
+
+        scale = self.scale
+        tl, br = self._search_corners(scale)
+        matched = self._corners_match(tl, br, scale)
+        if not matched:
+            detected, score = templates.detect_scale(self.frame_images.gray(),
+                                                     ('minimap_tl', 'minimap_br'))
+            if score >= CALIBRATION_THRESHOLD and detected != scale:
+                scale = detected
+                tl, br = self._search_corners(scale)
+                matched = self._corners_match(tl, br, scale)
+                self._set_scale(scale)
+        if matched:
+            self.calibrations[key] = (tl, br, scale)
+        return tl, br
+
+    def _search_corners(self, scale):
+        """Searches the entire frame for the corners of the minimap at the given SCALE."""
+
+        gray = self.frame_images.gray()
+        tl, _ = utils.pyramid_match(gray, templates.get('minimap_tl', scale), cv2.TM_CCOEFF)
+        br_template = templates.get('minimap_br', scale)
+        br_tl, _ = utils.pyramid_match(gray, br_template, cv2.TM_CCOEFF)
+        br = (br_tl[0] + br_template.shape[1], br_tl[1] + br_template.shape[0])
+        return tl, br
+
+    def _corners_match(self, tl, br, scale):
+        """Returns whether the corner templates at SCALE match the current frame at TL and BR."""
+
+        tl_template = templates.get('minimap_tl', scale)
+        br_template = templates.get('minimap_br', scale)
+        br_tl = (br[0] - br_template.shape[1], br[1] - br_template.shape[0])
+        return utils.match_score(self.frame, tl_template, tl) >= CALIBRATION_THRESHOLD \
+            and utils.match_score(self.frame, br_template, br_tl) >= CALIBRATION_THRESHOLD
+
+    def _set_scale(self, scale):
+        """Rescales this Capture's templates, and the whole registry if this Capture is shared."""
+
+        self.scale = scale
+        self.scanner.scale = scale
+        self.tracker.template = templates.get('player', scale)
+        if config.capture is self:
+            templates.set_scale(scale)
+
+    def _locate_window(self):
+        """Updates this Capture's window using the current position of the game window."""
+
+        corners = (templates.get('minimap_tl', self.scale), templates.get('minimap_br', self.scale))
+        rect = self.source.locate()
+        self.window['left'] = rect[0]
+        self.window['top'] = rect[1]
+        self.window['width'] = max(rect[2] - rect[0], *(t.shape[1] for t in corners))
+        self.window['height'] = max(rect[3] - rect[1], *(t.shape[0] for t in corners))
+
+    def wait_for_next(self, after_seq=None, timeout=None, full=False):
+        """
+        Blocks until Capture publishes a Snapshot that is newer than AFTER_SEQ.
+        :param after_seq:   The sequence id of the last Snapshot seen by the caller,
+                            defaults to the latest published Snapshot.
+        :param timeout:     The maximum number of seconds to wait, or None to wait forever.
+        :param full:        Whether the Snapshot must also contain a newer full frame. Full
+                            frames arrive every FRAME_INTERVAL seconds unless one is
+                            requested using REQUEST_FRAME.
+        :return:            The latest Snapshot, which is only older than requested
+                            if TIMEOUT expired. Its images are reused for later grabs,
+                            so they must be copied if they are needed for long.
+        """
+
+        with self.condition:
+            if after_seq is None:
+                after_seq = self.snapshot.seq if self.snapshot else 0
+            if full:
+                key = 'frame_seq'
+            else:
+                key = 'seq'
+                self.governor.demand()
+            self.condition.wait_for(
+                lambda: self.snapshot is not None and getattr(self.snapshot, key) > after_seq,
+                timeout
             )
-            self.minimap_ratio = (mm_br[0] - mm_tl[0]) / (mm_br[1] - mm_tl[1])
-            self.minimap_sample = self.frame[mm_tl[1]:mm_br[1], mm_tl[0]:mm_br[0]]
-            self.calibrated = True
-
-            with mss.mss() as self.sct:
-                while True:
-                    if not self.calibrated:
-                        break
-
-                    # Take screenshot
-                    self.frame = self.screenshot()
-                    if self.frame is None:
-                        continue
-
-                    # Crop the frame to only show the minimap
-                    minimap = self.frame[mm_tl[1]:mm_br[1], mm_tl[0]:mm_br[0]]
-
-                    # Determine the player's position
-                    player = utils.multi_match(minimap, PLAYER_TEMPLATE, threshold=0.8)
-                    if player:
-                        config.player_pos = utils.convert_to_relative(player[0], minimap)
-
-                    # Package display information to be polled by GUI
-                    self.minimap = {
-                        'minimap': minimap,
-                        'rune_active': config.bot.rune_active,
-                        'rune_pos': config.bot.rune_pos,
-                        'path': config.path,
-                        'player_pos': config.player_pos
-                    }
-
-                    if not self.ready:
-                        self.ready = True
-                    time.sleep(0.001)
-
-    def screenshot(self, delay=1):
+            return self.snapshot
+
+    def _next_seq(self):
+        """Returns the sequence id for the next Snapshot."""
+
+        return self.snapshot.seq + 1 if self.snapshot else 1
+
+    def _publish(self, snapshot):
+        """Makes SNAPSHOT the latest Snapshot and wakes up every waiting consumer."""
+
+        with self.condition:
+            self.snapshot = snapshot
+            self.condition.notify_all()
+
+    def request_frame(self):
+        """Makes the next iteration grab a full frame instead of only the minimap."""
+
+        self.frame_requested = True
+        self.governor.wake_up()
+
+    def screenshot(self, region=None, ring=None, delay=1):
+        """
+        Grabs REGION of the screen into the next buffer of RING, retrying after
+        DELAY seconds if unsuccessful.
+        :param region:  The area to grab, defaults to the entire game window.
+        :param ring:    The FrameRing to write into, defaults to the full frame ring.
+        :param delay:   The number of seconds to wait after an error.
+        :return:        The grabbed image, or None if the grab failed.
+        """
+
+        if region is None:
+            region = self.window
+        if ring is None:
+            ring = self.frames
         try:
-            return np.array(self.sct.grab(self.window))
-        except mss.exception.ScreenShotError:
+            return self.source.grab_into(region, ring.next(region['height'], region['width']))
+        except SourceError:
             print(f'\n[!] Error while taking screenshot, retrying in {delay} second'
                   + ('s' if delay != 1 else ''))
             time.sleep(delay)
+
+
+class CaptureGroup:
+    """
+    Tracks several game windows from a single process. Each window gets its own
+    Capture with independent calibration and player tracking, but instead of each
+    running its own thread, every Capture is stepped by one scheduler thread using
+    a shared pool of worker threads. The first Capture is shared through the config
+    module like a standalone Capture.
+    """
+
+    def __init__(self, sources, workers=2):
+        """
+        Creates a Capture for each FrameSource in SOURCES.
+        :param sources:     The FrameSources to track, one per game window.
+        :param workers:     The number of threads that grab and process frames.
+        """
+
+        self.wake = threading.Event()
+        self.captures = []
+        for i, source in enumerate(sources):
+            capture = Capture(source, primary=(i == 0))
+            capture.governor.wake = self.wake
+            self.captures.append(capture)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+        self.ready = False
+        self.thread = threading.Thread(target=self._main)
+        self.thread.daemon = True
+
+    @classmethod
+    def from_windows(cls, title='MapleStory', workers=2):
+        """Creates a CaptureGroup that tracks every open game window named TITLE."""
+
+        return cls([MssSource(title, handle=h) for h in find_windows(title)], workers=workers)
+
+    def __getitem__(self, item):
+        return self.captures[item]
+
+    def __len__(self):
+        return len(self.captures)
+
+    def start(self):
+        """Starts this CaptureGroup's scheduler thread."""
+
+        print(f'\n[~] Started video capture for {len(self.captures)} windows')
+        self.thread.start()
+
+    def _main(self):
+        """Steps each Capture whenever its RateGovernor says it is due."""
+
+        with ExitStack() as stack:
+            for capture in self.captures:
+                stack.enter_context(capture.source)
+            last_step = {capture: 0 for capture in self.captures}
+            while True:
+                active = [c for c in self.captures if not c.source.finished]
+                if not active:
+                    break
+                now = time.time()
+                due = [c for c in active if self._due(c, now, last_step[c])]
+                for future in [self.pool.submit(c.step, now) for c in due]:
+                    future.result()
+                for capture in due:
+                    last_step[capture] = now
+                    capture.governor.tick()
+                self.ready = all(c.ready for c in self.captures)
+
+                # Sleep until the next Capture is due, or until one is demanded
+                remaining = min(self._next_time(c, last_step[c]) for c in active) - time.time()
+                if remaining > 0:
+                    self.wake.wait(remaining)
+                self.wake.clear()
+        print('\n[~] Video capture has run out of frames')
+
+    @staticmethod
+    def _due(capture, now, last_step):
+        """Returns whether CAPTURE, last stepped at LAST_STEP, should be stepped at NOW."""
+
+        return capture.frame_requested or now >= CaptureGroup._next_time(capture, last_step)
+
+    @staticmethod
+    def _next_time(capture, last_step):
+        """Returns when CAPTURE is next due, which is immediately if its source is not paced."""
+
+        if not capture.source.paced:
+            return last_step
+        return capture.governor.next_time(last_step)
@@ -79,6 +79,10 @@ class GUI:
         display_thread.daemon = True
         display_thread.start()
 
+        stats_thread = threading.Thread(target=self._display_stats)
+        stats_thread.daemon = True
+        stats_thread.start()
+
         layout_thread = threading.Thread(target=self._save_layout)
         layout_thread.daemon = True
         layout_thread.start()
@@ -91,6 +95,17 @@ class GUI:
             self.view.minimap.display_minimap()
             time.sleep(delay)
 
+    def _display_stats(self):
+        """Periodically shows Capture's performance in the Status panel."""
+
+        while True:
+            governor = config.capture.governor
+            self.view.status.set_capture_stats(config.capture.stats.summary(),
+                                               config.player_confidence,
+                                               governor.fps,
+                                               governor.target_fps(time.time()))
+            time.sleep(1)
+
     def _save_layout(self):
         """Periodically saves the current Layout object."""
 
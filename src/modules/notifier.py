@@ -1,9 +1,8 @@
 """A module for detecting and notifying the user of dangerous in-game events."""
 
-from src.common import config, utils
+from src.common import config, templates, utils
 import time
 import os
-import cv2
 import pygame
 import threading
 import numpy as np
@@ -11,24 +10,6 @@ import keyboard as kb
 from src.routine.components import Point
 
 
-# A rune's symbol on the minimap
-RUNE_RANGES = (
-    ((141, 148, 245), (146, 158, 255)),
-)
-rune_filtered = utils.filter_color(cv2.imread('assets/rune_template.png'), RUNE_RANGES)
-RUNE_TEMPLATE = cv2.cvtColor(rune_filtered, cv2.COLOR_BGR2GRAY)
-
-# Other players' symbols on the minimap
-OTHER_RANGES = (
-    ((0, 245, 215), (10, 255, 255)),
-)
-other_filtered = utils.filter_color(cv2.imread('assets/other_template.png'), OTHER_RANGES)
-OTHER_TEMPLATE = cv2.cvtColor(other_filtered, cv2.COLOR_BGR2GRAY)
-
-# The Elite Boss's warning sign
-ELITE_TEMPLATE = cv2.imread('assets/elite_template.jpg', 0)
-
-
 def get_alert_path(name):
     return os.path.join(Notifier.ALERTS_DIR, f'{name}.mp3')
 
@@ -58,27 +39,33 @@ class Notifier:
     def _main(self):
         self.ready = True
         prev_others = 0
+        prev_seq = 0
         rune_start_time = time.time()
         while True:
             if config.enabled:
-                frame = config.capture.frame
+                # Wait for a full frame that has not been checked yet
+                snapshot = config.capture.wait_for_next(prev_seq, timeout=1, full=True)
+                if snapshot is None or snapshot.frame_seq <= prev_seq:
+                    continue
+                prev_seq = snapshot.frame_seq
+                frame = snapshot.frame
                 height, width, _ = frame.shape
-                minimap = config.capture.minimap['minimap']
+                minimap = snapshot.minimap
 
                 # Check for unexpected black screen
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                gray = snapshot.gray()
                 if np.count_nonzero(gray < 15) / height / width > self.room_change_threshold:
                     self._alert('siren')
 
                 # Check for elite warning
-                elite_frame = frame[height // 4:3 * height // 4, width // 4:3 * width // 4]
-                elite = utils.multi_match(elite_frame, ELITE_TEMPLATE, threshold=0.9)
-                if len(elite) > 0:
+                elite_frame = gray[height // 4:3 * height // 4, width // 4:3 * width // 4]
+                _, elite = utils.pyramid_match(elite_frame, templates.get('elite'))
+                if elite >= 0.9:
                     self._alert('siren')
 
                 # Check for other players entering the map
-                filtered = utils.filter_color(minimap, OTHER_RANGES)
-                others = len(utils.multi_match(filtered, OTHER_TEMPLATE, threshold=0.5))
+                state = snapshot.minimap_state
+                others = len(state.others)
                 config.stage_fright = others > 0
                 if others != prev_others:
                     if others > prev_others:
@@ -88,12 +75,9 @@ class Notifier:
                 # Check for rune
                 now = time.time()
                 if not config.bot.rune_active:
-                    filtered = utils.filter_color(minimap, RUNE_RANGES)
-                    matches = utils.multi_match(filtered, RUNE_TEMPLATE, threshold=0.9)
                     rune_start_time = now
-                    if matches and config.routine.sequence:
-                        abs_rune_pos = (matches[0][0], matches[0][1])
-                        config.bot.rune_pos = utils.convert_to_relative(abs_rune_pos, minimap)
+                    if state.rune is not None and config.routine.sequence:
+                        config.bot.rune_pos = utils.convert_to_relative(state.rune, minimap)
                         distances = list(map(distance_to_rune, config.routine.sequence))
                         index = np.argmin(distances)
                         config.bot.rune_closest_pos = config.routine[index].location
@@ -102,7 +86,8 @@ class Notifier:
                 elif now - rune_start_time > self.rune_alert_delay:     # Alert if rune hasn't been solved
                     config.bot.rune_active = False
                     self._alert('siren')
-            time.sleep(0.05)
+            else:
+                time.sleep(0.05)
 
     def _alert(self, name, volume=0.75):
         """
@@ -247,13 +247,14 @@ class Move(Command):
         for i, point in enumerate(path):
             toggle = True
             self.prev_direction = ''
-            local_error = utils.distance(config.player_pos, point)
-            global_error = utils.distance(config.player_pos, self.target)
+            pos = utils.predict_player(settings.stop_lag)       # Where the player will stop
+            local_error = utils.distance(pos, point)
+            global_error = utils.distance(pos, self.target)
             while config.enabled and counter > 0 and \
                     local_error > settings.move_tolerance and \
                     global_error > settings.move_tolerance:
                 if toggle:
-                    d_x = point[0] - config.player_pos[0]
+                    d_x = point[0] - pos[0]
                     if abs(d_x) > settings.move_tolerance / math.sqrt(2):
                         if d_x < 0:
                             key = 'left'
@@ -267,7 +268,7 @@ class Move(Command):
                         if i < len(path) - 1:
                             time.sleep(0.15)
                 else:
-                    d_y = point[1] - config.player_pos[1]
+                    d_y = point[1] - pos[1]
                     if abs(d_y) > settings.move_tolerance / math.sqrt(2):
                         if d_y < 0:
                             key = 'up'
@@ -280,8 +281,10 @@ class Move(Command):
                         counter -= 1
                         if i < len(path) - 1:
                             time.sleep(0.05)
-                local_error = utils.distance(config.player_pos, point)
-                global_error = utils.distance(config.player_pos, self.target)
+                config.capture.wait_for_next(timeout=0.1)      # Position after the step
+                pos = utils.predict_player(settings.stop_lag)
+                local_error = utils.distance(pos, point)
+                global_error = utils.distance(pos, self.target)
                 toggle = not toggle
             if self.prev_direction:
                 key_up(self.prev_direction)